@@ -64,6 +64,8 @@ while read -d ' ' -r commit ; do
         continue
     fi
 
+    build_start="$(date +%s)"
+
     cd "${BT_SRCDIR}"
 
     # Clean the source dir
@@ -95,8 +97,11 @@ while read -d ' ' -r commit ; do
         BT_BIN=$PREFIX/bin/babeltrace
     fi
 
+    benchmark_start="$(date +%s)"
+
     cd "$BENCHMARK_DIR"
 
+    PACK_INPUTS=()
     for trace in "${TRACES[@]}" ; do
         trace_location_var="TRACE_${trace^^}_LOCATION"
         trace_location="${!trace_location_var}"
@@ -121,13 +126,23 @@ while read -d ' ' -r commit ; do
                 ARGS+=("-o" "dummy")
             fi
 
-            python3 "$BASE_DIR/scripts/babeltrace-benchmark/time.py" --output=result --command "$BT_BIN" "${ARGS[*]}" --iteration 5 --taskset 0
+            result="result-${sink}-${trace}"
+            python3 "$BASE_DIR/scripts/babeltrace-benchmark/time.py" --output="$result" --command "$BT_BIN" "${ARGS[*]}" --iteration 5 --taskset 0
 
-            upload_artifact result "results/benchmarks/babeltrace/${sink}-${trace}/${commit}"
+            upload_artifact "$result" "results/benchmarks/babeltrace/${sink}-${trace}/${commit}"
 
-            rm -f result
+            PACK_INPUTS+=("${sink}-${trace}=${result}")
         done
     done
 
+    # All the results of the commit in one compact file, see result_format.py
+    python3 "$BASE_DIR/scripts/babeltrace-benchmark/result_format.py" pack --output result-packed "${PACK_INPUTS[@]}"
+    upload_artifact result-packed "results/benchmarks/babeltrace/packed/${commit}"
+    rm -f result-*
+
     rm -rf "$PREFIX"
+
+    # Used by benchmark.py to size the next batches and their timeouts
+    benchmark_end="$(date +%s)"
+    echo "BENCHMARK_DURATION commit=${commit} build=$((benchmark_start - build_start)) benchmark=$((benchmark_end - benchmark_start))"
 done <<< "${BT_COMMITS}"
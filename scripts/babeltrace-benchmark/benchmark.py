@@ -3,21 +3,34 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import argparse
+import calendar
+import email.utils
+import hashlib
 import json
+import math
 import os
 import sys
 import tempfile
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from operator import add
-from statistics import mean
 
+import certifi
 import git
+import job_durations
 import lava_submit
 import matplotlib.pyplot as plt
 import numpy
+import result_cache
+import result_format
+import urllib3
+from jinja2 import Environment, FileSystemLoader
 from matplotlib.backends.backend_pdf import PdfPages
 from matplotlib.ticker import PercentFormatter
 from minio import Minio
 from minio.error import NoSuchKey, ResponseError
+from pypdf import PdfWriter
 
 BENCHMARK_TYPES = [
     "dummy-default",
@@ -30,12 +43,53 @@ BENCHMARK_TYPES = [
     "text-tools_2_14",
 ]
 
+BENCHMARK_TYPE_TITLES = {
+    "dummy-default": "Dummy output",
+    "text-default": "Text output",
+    "dummy-tools_2_10": "Dummy output with tools 2.10 trace",
+    "text-tools_2_10": "Text output with tools 2.10 trace",
+    "dummy-tools_2_14": "Dummy output with tools 2.14 trace",
+    "text-tools_2_14": "Text output with tools 2.14 trace",
+}
+
+REPORT_FORMATS = ["pdf", "html", "json"]
+
+# Pseudo benchmark type of the compact result files holding the results of
+# all the benchmark types of a commit, see result_format.py
+PACKED_RESULT_TYPE = "packed"
+
+# Per commit metrics derived from the hardware counters recorded by
+# `time.py --perf-counters`
+COUNTER_METRIC_TITLES = {
+    "ipc": "Instructions per cycle",
+    "cache_mpki": "Cache misses per 1000 instructions",
+    "branch_mpki": "Branch misses per 1000 instructions",
+}
+
 # Get S3 config from environment
 S3_HOST = os.getenv("S3_HOST")
 S3_BUCKET = os.getenv("S3_BUCKET")
 S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY")
 S3_SECRET_KEY = os.getenv("S3_SECRET_KEY")
 
+# Number of concurrent S3 downloads when fetching results
+DEFAULT_FETCH_JOBS = 16
+
+# Bisection scheduling defaults
+DEFAULT_BISECT_SAMPLE_STEP = 10
+DEFAULT_BISECT_THRESHOLD = 0.03
+DEFAULT_BISECT_ROUNDS = 10
+DEFAULT_BISECT_MAX_ATTEMPTS = 2
+
+# Bump when the rendering of the report pages changes to invalidate the pages
+# cached by previous versions.
+PAGE_FORMAT_VERSION = 2
+
+# Change-point detection defaults, the window is expressed in commits
+DEFAULT_CP_WINDOW = 8
+DEFAULT_CP_ALPHA = 1e-5
+DEFAULT_CP_MIN_EFFECT = 0.02
+
 invalid_commits = {
     "ec9a9794af488a9accce7708a8b0d8188b498789",  # Does not build
     "8c99128c640cbce71fb8a6caa15e4c672252b662",  # Block on configure
@@ -114,39 +168,148 @@ def graph_get_title(branch, benchmark_type):
     """
     Get title for graph based on benchmark type.
     """
-    string = {
-        "dummy-default": "Dummy output",
-        "text-default": "Text output",
-        "dummy-tools_2_10": "Dummy output with tools 2.10 trace",
-        "text-tools_2_10": "Text output with tools 2.10 trace",
-        "dummy-tools_2_14": "Dummy output with tools 2.14 trace",
-        "text-tools_2_14": "Text output with tools 2.14 trace",
-    }
-    return "{} - {}".format(branch, string[benchmark_type])
+    return "{} - {}".format(branch, BENCHMARK_TYPE_TITLES[benchmark_type])
 
 
-def get_client():
+def get_client(pool_size=None):
     """
     Return minio client configured.
+    When pool_size is set, the client keeps up to pool_size connections open
+    so it can be shared by that many concurrent threads.
     """
+    http_client = None
+    if pool_size:
+        http_client = urllib3.PoolManager(
+            timeout=urllib3.Timeout.DEFAULT_TIMEOUT,
+            maxsize=pool_size,
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+            retries=urllib3.Retry(
+                total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]
+            ),
+        )
     return Minio(
-        S3_HOST, access_key=S3_ACCESS_KEY, secret_key=S3_SECRET_KEY
+        S3_HOST,
+        access_key=S3_ACCESS_KEY,
+        secret_key=S3_SECRET_KEY,
+        http_client=http_client,
     )
 
 
-def get_file(client, prefix, file_name, workdir_name):
+def get_result_prefix(benchmark_type):
     """
-    Return the path of the downloaded file.
-    Return None on error
+    Return the remote prefix holding the results of a benchmark type.
     """
-    destination = os.path.join(workdir_name, file_name)
-    object_name = "{}/{}".format(prefix, file_name)
+    return "/results/benchmarks/babeltrace/{}".format(benchmark_type)
+
+
+def s3_timestamp(value):
+    """
+    Convert a last modification date as returned by S3 (HTTP header, struct_time
+    or datetime depending on the request) to a POSIX timestamp.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    if isinstance(value, time.struct_time):
+        return float(calendar.timegm(value))
+    return value.timestamp()
+
+
+def get_result_data(client, b_type, commit, cache=None, validate=False, etag=None):
+    """
+    Return the content of the result file of a commit for a benchmark type.
+    Return None if the result does not exist.
+
+    When a cache is given, a cached result is used as-is unless validate is
+    set, in which case its ETag (or last modification date) is first checked
+    against S3. When the ETag of the remote object is already known (e.g. from
+    a listing), it is used to validate the cached result without a request.
+    """
+    object_name = "{}/{}".format(get_result_prefix(b_type), commit)
+    cached = cache.get(b_type, commit) if cache else None
+    if cached and etag:
+        if cached[1] == etag:
+            return cached[0]
+    elif cached and validate:
+        try:
+            stat = client.stat_object(S3_BUCKET, object_name)
+        except NoSuchKey:
+            cache.discard(b_type, commit)
+            return None
+        data, etag, last_modified = cached
+        if etag and etag == stat.etag:
+            return data
+        if not etag and last_modified == s3_timestamp(stat.last_modified):
+            return data
+    elif cached:
+        return cached[0]
+
     try:
-        client.fget_object(S3_BUCKET, object_name, destination)
+        response = client.get_object(S3_BUCKET, object_name)
     except NoSuchKey:
         return None
+    data = response.data
+    response.release_conn()
+
+    if cache:
+        cache.put(
+            b_type,
+            commit,
+            data,
+            etag=response.headers.get("etag", "").replace('"', "") or None,
+            last_modified=s3_timestamp(response.headers.get("last-modified")),
+        )
+    return data
+
+
+def get_result_index(client, jobs=len(BENCHMARK_TYPES) + 1):
+    """
+    List the results available on remote for every benchmark type and the
+    compact results, using one (paginated) listing per type. Return a
+    dictionary of the form {commit: {benchmark_type: minio.Object}}.
+    """
+
+    def list_results(b_type):
+        # Object keys are not prefixed by a slash.
+        prefix = get_result_prefix(b_type).lstrip("/") + "/"
+        return b_type, list(client.list_objects(S3_BUCKET, prefix, recursive=True))
+
+    index = defaultdict(dict)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for b_type, objects in executor.map(
+            list_results, BENCHMARK_TYPES + [PACKED_RESULT_TYPE]
+        ):
+            for obj in objects:
+                index[obj.object_name.rsplit("/", 1)[-1]][b_type] = obj
+    return index
+
+
+def load_result_index(client):
+    """
+    Return the result index or None if nothing could be listed, in which case
+    the results are checked one object at a time.
+    """
+    index = get_result_index(client)
+    if not index:
+        print("No results listed on remote, checking each result individually")
+        return None
+    print("Listed results for {} commits".format(len(index)))
+    return index
+
 
-    return destination
+def is_result_complete(index, commit):
+    """
+    Return whether the result index holds a non-empty compact result file or
+    a non-empty result file for every benchmark type of a commit.
+    """
+    objects = index.get(commit, {})
+    if PACKED_RESULT_TYPE in objects and objects[PACKED_RESULT_TYPE].size > 0:
+        return True
+    return all(
+        b_type in objects and objects[b_type].size > 0 for b_type in BENCHMARK_TYPES
+    )
 
 
 def delete_file(client, prefix, file_name):
@@ -162,72 +325,352 @@ def delete_file(client, prefix, file_name):
         pass
 
 
-def get_git_log(bt_version, cutoff, bt_repo_path):
+# Memoized histories, see get_git_history()
+_git_history = {}
+_fetched_repos = set()
+
+
+def reachable_commits(parents, start):
     """
-    Return an ordered (older to newer) list of commits for the bt_version and
-    cutoff. WARNING: This changes the git repo HEAD.
+    Return the set of commits of the `parents` graph reachable from start.
     """
-    repo = git.Repo(bt_repo_path)
-    repo.git.fetch()
-    return repo.git.log(
-        "{}..origin/{}".format(cutoff, bt_version), "--pretty=format:%H", "--reverse"
-    ).split("\n")
+    reachable = set()
+    stack = [start]
+    while stack:
+        commit = stack.pop()
+        if commit in reachable or commit not in parents:
+            continue
+        reachable.add(commit)
+        stack.extend(parents[commit])
+    return reachable
 
 
-def parse_result(result_path):
+def get_git_history(branches, bt_repo_path, cache_file=None):
     """
-    Parse the result file. Return a dataset of User time + System time.
+    Return a (branch_commits, commit_info) tuple for the branches of the
+    form {branch: cutoff}, where branch_commits holds the ordered (older to
+    newer) list of commits of cutoff..origin/branch for each branch and
+    commit_info the date and subject of each of these commits.
+
+    The repository is fetched once and the history of all the branches is
+    read with a single git log call, the working tree and HEAD are not
+    touched. The result is memoized for the lifetime of the process and,
+    when cache_file is set, stored on disk to be reused by the next runs as
+    long as the branch heads did not move.
     """
-    with open(result_path) as result:
-        parsed_result = json.load(result)
-        return list(
-            map(
-                add,
-                parsed_result["User time (seconds)"],
-                parsed_result["System time (seconds)"],
+    repo_path = os.path.realpath(bt_repo_path)
+    key = json.dumps([repo_path, sorted(branches.items())])
+    if key in _git_history:
+        return _git_history[key]
+
+    repo = git.Repo(repo_path)
+    if repo_path not in _fetched_repos:
+        repo.git.fetch()
+        _fetched_repos.add(repo_path)
+
+    refs = repo.git.rev_parse(
+        *["origin/{}".format(branch) for branch in branches], *branches.values()
+    ).split("\n")
+    heads = refs[: len(branches)]
+    cutoffs = refs[len(branches) :]
+    cache_key = json.dumps([key, heads])
+    if cache_file and os.path.exists(cache_file):
+        with open(cache_file) as cached:
+            cached_history = json.load(cached)
+        if cached_history.get("key") == cache_key:
+            history = (cached_history["commits"], cached_history["info"])
+            _git_history[key] = history
+            return history
+
+    # The commits reachable from every cutoff are not part of any range.
+    exclude = []
+    try:
+        exclude = ["^{}".format(repo.git.merge_base("--octopus", *cutoffs))]
+    except git.GitCommandError:
+        pass
+
+    parents = {}
+    order = []
+    commit_info = {}
+    log = repo.git.log(
+        "--date-order",
+        "--reverse",
+        "--format=%H%x1f%P%x1f%cI%x1f%s",
+        *heads,
+        *cutoffs,
+        *exclude,
+    )
+    for line in log.splitlines():
+        commit, commit_parents, date, subject = line.split("\x1f", 3)
+        parents[commit] = commit_parents.split()
+        order.append(commit)
+        commit_info[commit] = {"date": date, "subject": subject}
+
+    branch_commits = {}
+    for branch, head, cutoff in zip(branches, heads, cutoffs):
+        in_range = reachable_commits(parents, head) - reachable_commits(parents, cutoff)
+        branch_commits[branch] = [c for c in order if c in in_range]
+
+    used = set(c for commits in branch_commits.values() for c in commits)
+    commit_info = {c: info for c, info in commit_info.items() if c in used}
+    history = (branch_commits, commit_info)
+    _git_history[key] = history
+
+    if cache_file:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        with open(cache_file, "w") as out:
+            json.dump(
+                {"key": cache_key, "commits": branch_commits, "info": commit_info},
+                out,
             )
+    return history
+
+
+def get_result_dataset(parsed_result):
+    """
+    Return the dataset of User time + System time of a parsed result file.
+    """
+    return list(
+        map(
+            add,
+            parsed_result["User time (seconds)"],
+            parsed_result["System time (seconds)"],
+        )
+    )
+
+
+def get_result_counters(parsed_result):
+    """
+    Return the median over the iterations of the metrics derived from the
+    hardware counters of a parsed result file (see COUNTER_METRIC_TITLES),
+    None if the counters were not recorded. A metric is NaN when one of its
+    counters is not available.
+    """
+    cycles = parsed_result.get("Cycles")
+    if cycles is None or not len(cycles):
+        return None
+
+    def counter(key):
+        return numpy.array(
+            [numpy.nan if v is None else v for v in parsed_result.get(key, [])],
+            dtype=float,
+        )
+
+    cycles = counter("Cycles")
+    instructions = counter("Instructions")
+    metrics = {}
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        per_iteration = {
+            "ipc": instructions / cycles,
+            "cache_mpki": counter("Cache misses") * 1000 / instructions,
+            "branch_mpki": counter("Branch misses") * 1000 / instructions,
+        }
+    for metric, values in per_iteration.items():
+        values = values[numpy.isfinite(values)]
+        metrics[metric] = float(numpy.median(values)) if values.size else math.nan
+    return metrics
+
+
+def get_series_counters(counters):
+    """
+    Return the counter metrics of a series, a dictionary of arrays with one
+    value per commit (NaN when missing), from the per commit metrics returned
+    by get_result_counters().
+    """
+    return {
+        metric: numpy.array(
+            [c[metric] if c else numpy.nan for c in counters], dtype=float
+        )
+        for metric in COUNTER_METRIC_TITLES
+    }
+
+
+SeriesStats = namedtuple(
+    "SeriesStats",
+    ["samples", "inliers", "lower", "upper", "mean", "median", "ci", "count"],
+)
+
+
+def compute_series_stats(datasets):
+    """
+    Compute the statistics of a series of datasets (one per commit) in a
+    single vectorized pass.
+
+    The datasets are loaded in a 2-D array padded with NaN. Outliers are
+    identified using IQR 1.5 [1], the mean, median and 95% confidence
+    interval (normal approximation) of each row are computed on the inliers
+    only.
+    [1] https://en.wikipedia.org/wiki/Interquartile_range#Outliers
+    """
+    width = max((len(d) for d in datasets), default=0)
+    samples = numpy.full((len(datasets), width), numpy.nan)
+    for row, dataset in enumerate(datasets):
+        samples[row, : len(dataset)] = dataset
+
+    if not samples.size:
+        empty = numpy.empty(len(datasets))
+        return SeriesStats(
+            samples,
+            numpy.zeros(samples.shape, dtype=bool),
+            empty,
+            empty,
+            empty,
+            empty,
+            empty,
+            numpy.zeros(len(datasets), dtype=int),
         )
 
+    q1, q3 = numpy.nanpercentile(samples, [25, 75], axis=1)
+    iqr = q3 - q1
+    lower = q1 - (1.5 * iqr)
+    upper = q3 + (1.5 * iqr)
+    # Comparisons against NaN are false, padding is never an inlier.
+    inliers = (samples >= lower[:, None]) & (samples <= upper[:, None])
+
+    kept = numpy.where(inliers, samples, numpy.nan)
+    count = inliers.sum(axis=1)
+    mean = numpy.nanmean(kept, axis=1)
+    median = numpy.nanmedian(kept, axis=1)
+    stdev = numpy.zeros(len(datasets))
+    several = count > 1
+    stdev[several] = numpy.nanstd(kept[several], axis=1, ddof=1)
+    ci = 1.96 * stdev / numpy.sqrt(numpy.maximum(count, 1))
+    return SeriesStats(samples, inliers, lower, upper, mean, median, ci, count)
+
+
+def get_series_stats(branch_results):
+    """
+    Compute the statistics of every (branch, benchmark type) series of
+    branch_results (see get_branch_results()) once. Return a dictionary of the
+    form {(branch, benchmark_type): SeriesStats}.
+    """
+    return {
+        (branch, b_type): compute_series_stats([c[1][b_type] for c in results])
+        for branch, results in branch_results.items()
+        for b_type in BENCHMARK_TYPES
+    }
+
 
-def get_benchmark_results(client, commit, workdir):
+def check_benchmark_results(commit, result_data, cache=None):
     """
-    Fetch the benchmark result from a certain commit across all benchmark type.
+    Parse the result files content of a commit, indexed by benchmark type, or
+    the compact result file of the commit, indexed by PACKED_RESULT_TYPE.
+    Return the results, whether they are valid and the hardware counter
+    metrics (see get_result_counters()) of each benchmark type. Invalid
+    results are removed from the cache so they are fetched again once re-run.
     """
     results = {}
+    counters = {}
     benchmark_valid = True
+    packed = PACKED_RESULT_TYPE in result_data
+    if packed:
+        data = result_data[PACKED_RESULT_TYPE]
+        if not data:
+            return None, False, None
+        try:
+            parsed_results = result_format.loads(data)
+        except result_format.ResultFormatError as error:
+            print("Invalid packed result for {}: {}".format(commit, error))
+            if cache:
+                cache.discard(PACKED_RESULT_TYPE, commit)
+            return None, False, None
+    else:
+        parsed_results = {}
+        for b_type in BENCHMARK_TYPES:
+            if result_data.get(b_type):
+                parsed_results[b_type] = json.loads(result_data[b_type])
+
     for b_type in BENCHMARK_TYPES:
-        prefix = "/results/benchmarks/babeltrace/{}".format(b_type)
-        result_file = get_file(client, prefix, commit, workdir)
-        if not result_file:
+        prefix = get_result_prefix(b_type)
+        parsed_result = parsed_results.get(b_type)
+        if not parsed_result:
             """
             Benchmark is either corrupted or not complete.
             """
-            return None, False
-        results[b_type] = parse_result(result_file)
+            return None, False, None
+        results[b_type] = get_result_dataset(parsed_result)
+        counters[b_type] = get_result_counters(parsed_result)
         if all(i == 0.0 for i in results[b_type]):
             benchmark_valid = False
+            if cache:
+                cache.discard(PACKED_RESULT_TYPE if packed else b_type, commit)
             print("Invalid benchmark for {}/{}/{}".format(prefix, b_type, commit))
     # The dataset is valid return immediately.
-    return results, benchmark_valid
+    return results, benchmark_valid, counters
 
 
-def plot_raw_value(branch, benchmark_type, x_data, y_data, labels, latest_values):
+def fetch_benchmark_results(
+    client, commits, cache=None, jobs=DEFAULT_FETCH_JOBS, validate=False, index=None
+):
+    """
+    Fetch the benchmark results of many commits using up to `jobs` concurrent
+    downloads. The client must have a connection pool large enough to be
+    shared by all the workers, see get_client().
+
+    When a result index (see get_result_index()) is given, commits with missing
+    or empty result files are not downloaded at all and the listed ETags are
+    used to validate the cached results. The compact result file of a commit
+    is downloaded instead of its result files when it exists.
+
+    Yield (commit, results, valid, counters) tuples in the order of commits,
+    see check_benchmark_results().
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = []
+        for commit in commits:
+            if index is not None and not is_result_complete(index, commit):
+                pending.append((commit, None))
+                continue
+            # Without an index, whether the compact result exists is unknown,
+            # it is requested first.
+            b_types = [PACKED_RESULT_TYPE]
+            if index is not None:
+                packed = index[commit].get(PACKED_RESULT_TYPE)
+                if packed is None or packed.size == 0:
+                    b_types = BENCHMARK_TYPES
+            futures = {}
+            for b_type in b_types:
+                etag = index[commit][b_type].etag if index is not None else None
+                futures[b_type] = executor.submit(
+                    get_result_data, client, b_type, commit, cache, validate, etag
+                )
+            pending.append((commit, futures))
+
+        def get_type_data(b_type, commit):
+            return get_result_data(client, b_type, commit, cache, validate)
+
+        for commit, futures in pending:
+            if futures is None:
+                yield commit, None, False, None
+                continue
+            result_data = {
+                b_type: future.result() for b_type, future in futures.items()
+            }
+            if index is None and not result_data[PACKED_RESULT_TYPE]:
+                result_data = dict(
+                    zip(
+                        BENCHMARK_TYPES,
+                        executor.map(
+                            get_type_data,
+                            BENCHMARK_TYPES,
+                            [commit] * len(BENCHMARK_TYPES),
+                        ),
+                    )
+                )
+            yield (commit, *check_benchmark_results(commit, result_data, cache))
+
+
+def plot_raw_value(branch, benchmark_type, x_data, series_stats, labels, latest_values):
     """
     Plot the graph using the raw value.
     """
-    point_x_data = []
-    outlier_x_data = []
-    point_y_data = []
-    outlier_y_data = []
-    for pos in range(len(x_data)):
-        x = x_data[pos]
-        valid_points, outliers = sanitize_dataset(y_data[pos])
-        for y in valid_points:
-            point_x_data.append(x)
-            point_y_data.append(y)
-        for y in outliers:
-            outlier_x_data.append(x)
-            outlier_y_data.append(y)
+    samples = series_stats.samples
+    x_samples = numpy.broadcast_to(numpy.asarray(x_data)[:, None], samples.shape)
+    outliers = ~series_stats.inliers & ~numpy.isnan(samples)
+    point_x_data = x_samples[series_stats.inliers]
+    point_y_data = samples[series_stats.inliers]
+    outlier_x_data = x_samples[outliers]
+    outlier_y_data = samples[outliers]
 
     plt.plot(
         point_x_data, point_y_data, "o", label=branch, color=graph_get_color(branch)
@@ -235,9 +678,8 @@ def plot_raw_value(branch, benchmark_type, x_data, y_data, labels, latest_values
     plt.plot(outlier_x_data, outlier_y_data, "+", label="outlier", color="black")
 
     ymax = 1
-    if y_data:
-        ymin = 0.8 * min([item for sublist in y_data for item in sublist])
-        ymax = 1.2 * max([item for sublist in y_data for item in sublist])
+    if samples.size:
+        ymax = 1.2 * numpy.nanmax(samples)
     # Put latest of other branches for reference as horizontal line.
     for l_branch, l_result in latest_values.items():
         if not l_result or l_branch == branch:
@@ -369,26 +811,165 @@ def plot_ratio(branch, benchmark_type, x_data, y_data, labels, latest_values):
     return
 
 
-def generate_graph(branches, report_name, git_path):
+def plot_counters(branch, benchmark_type, x_data, counters, labels, latest_values):
+    """
+    Plot the instructions per cycle and the cache and branch misses per 1000
+    instructions of each commit.
+    """
+    ax = plt.gca()
+    lines = ax.plot(
+        x_data,
+        counters["ipc"],
+        "o-",
+        label=COUNTER_METRIC_TITLES["ipc"],
+        color=graph_get_color(branch),
+    )
+    ax.set_ylim(ymin=0)
+    ax.set_ylabel("Instructions per cycle")
+
+    misses_ax = ax.twinx()
+    for metric, style, color in [
+        ("cache_mpki", "s--", "tab:red"),
+        ("branch_mpki", "^:", "tab:purple"),
+    ]:
+        lines += misses_ax.plot(
+            x_data,
+            counters[metric],
+            style,
+            label=COUNTER_METRIC_TITLES[metric],
+            color=color,
+        )
+    misses_ax.set_ylim(ymin=0)
+    misses_ax.set_ylabel("Misses per 1000 instructions")
+
+    ax.set_xticks(x_data)
+    ax.set_xticklabels(labels, rotation=90, family="monospace")
+    ax.set_title(
+        graph_get_title(branch, benchmark_type) + " Hardware counters",
+        fontweight="bold",
+    )
+    ax.set_xlabel("Latest commits")
+    ax.legend(lines, [line.get_label() for line in lines])
+    ax.grid(True)
+
+    plt.tight_layout()
+    return
 
-    # The PDF document
-    pdf_pages = PdfPages(report_name)
 
-    client = get_client()
+def get_branch_results(
+    branches,
+    git_path,
+    fetch_jobs=DEFAULT_FETCH_JOBS,
+    cache=None,
+    validate_cache=False,
+    use_index=True,
+    history_file=None,
+):
+    """
+    Fetch the valid results of each branch. Return a dictionary of the form
+    {branch: [(commit, {benchmark_type: dataset}, {benchmark_type: counters}),
+    ...]} where the commits are ordered from older to newer, see
+    get_result_counters() for the counters.
+    """
+    client = get_client(pool_size=fetch_jobs)
     branch_results = dict()
+    index = load_result_index(client) if use_index else None
+    branch_commits = get_git_history(branches, git_path, history_file)[0]
 
-    # Fetch the results for each branch.
-    for branch, cutoff in branches.items():
-        commits = get_git_log(branch, cutoff, git_path)
+    for branch, commits in branch_commits.items():
         results = []
-        with tempfile.TemporaryDirectory() as workdir:
-            for commit in commits:
-                b_results, valid = get_benchmark_results(client, commit, workdir)
-                if not b_results or not valid:
-                    continue
-                results.append((commit, b_results))
+        for commit, b_results, valid, counters in fetch_benchmark_results(
+            client, commits, cache, fetch_jobs, validate_cache, index
+        ):
+            if not b_results or not valid:
+                continue
+            results.append((commit, b_results, counters))
         branch_results[branch] = results
 
+    return branch_results
+
+
+def get_page_key(branch, b_type, labels, stats, latest_values, width, counters=None):
+    """
+    Return the key of the cached pages of a series, a hash of all the inputs
+    of its rendering.
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps(
+            [PAGE_FORMAT_VERSION, branch, b_type, labels, latest_values, width]
+        ).encode()
+    )
+    digest.update(stats.samples.tobytes())
+    for metric in COUNTER_METRIC_TITLES if counters else []:
+        digest.update(counters[metric].tobytes())
+    return digest.hexdigest()
+
+
+def render_series_pages(
+    path, branch, b_type, labels, stats, latest_values, width, counters=None
+):
+    """
+    Render the raw value, ratio and delta pages of a (branch, benchmark type)
+    series to a pdf file, followed by the hardware counters page when
+    counters (see get_series_counters()) were recorded for any commit.
+    Return the path of the file.
+    """
+    x_data = list(range(len(labels)))
+    # Use the mean of each sanitize dataset here, we do not care for
+    # variance for ratio. At least not yet.
+    y_data = list(stats.mean)
+    plots = [
+        (plot_raw_value, stats),
+        (plot_ratio, y_data),
+        (plot_delta_between_point, y_data),
+    ]
+    if counters and any(numpy.isfinite(v).any() for v in counters.values()):
+        plots.append((plot_counters, counters))
+
+    # Render to a temporary file so an interrupted run does not leave a
+    # truncated page in the cache.
+    tmp_path = "{}.tmp".format(path)
+    with PdfPages(tmp_path) as pdf_pages:
+        for plot, data in plots:
+            fig = plt.figure(figsize=(width, 8.27), dpi=100)
+            plot(branch, b_type, x_data, data, labels, latest_values)
+            pdf_pages.savefig(fig)
+            plt.close(fig)
+    os.replace(tmp_path, path)
+    return path
+
+
+def generate_graph(
+    branch_results, report_name, page_dir=None, jobs=None, series_stats=None
+):
+    """
+    Generate the pdf report. The pages of each (branch, benchmark type) series
+    are rendered in parallel using up to `jobs` processes and kept in
+    page_dir, keyed on the hash of their input data, so that unchanged series
+    are not redrawn on the next run. The statistics of the series are
+    computed unless given, see get_series_stats().
+    """
+    if page_dir is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            return generate_graph(
+                branch_results, report_name, tmp_dir, jobs, series_stats
+            )
+
+    os.makedirs(page_dir, exist_ok=True)
+
+    if series_stats is None:
+        series_stats = get_series_stats(branch_results)
+    series_counters = {}
+    for branch, results in branch_results.items():
+        for b_type in BENCHMARK_TYPES:
+            series_counters[(branch, b_type)] = get_series_counters(
+                [c[2][b_type] for c in results]
+            )
+
+    # The page files of the report, in order.
+    page_paths = []
+    to_render = []
     for b_type in BENCHMARK_TYPES:
         latest_values = {}
         max_len = 0
@@ -400,9 +981,7 @@ def generate_graph(branches, report_name, git_path):
         for branch, results in branch_results.items():
             max_len = max([max_len, len(results)])
             if results:
-                latest_values[branch] = mean(
-                    sanitize_dataset(results[-1][1][b_type])[0]
-                )
+                latest_values[branch] = float(series_stats[(branch, b_type)].mean[-1])
             else:
                 latest_values[branch] = None
 
@@ -413,63 +992,379 @@ def generate_graph(branches, report_name, git_path):
             else:
                 width = 11.69
 
-            x_data = list(range(len(results)))
-            y_data = [c[1][b_type] for c in results]
+            stats = series_stats[(branch, b_type)]
+            counters = series_counters[(branch, b_type)]
             labels = [c[0][:8] for c in results]
+            key = get_page_key(
+                branch, b_type, labels, stats, latest_values, width, counters
+            )
+            path = os.path.join(page_dir, "{}.pdf".format(key))
+            page_paths.append(path)
+            if os.path.exists(path):
+                continue
+            to_render.append(
+                (path, branch, b_type, labels, stats, latest_values, width, counters)
+            )
 
-            fig = plt.figure(figsize=(width, 8.27), dpi=100)
-            plot_raw_value(branch, b_type, x_data, y_data, labels, latest_values)
-            pdf_pages.savefig(fig)
+    print(
+        "Rendering {} of {} series, the others are cached".format(
+            len(to_render), len(page_paths)
+        )
+    )
+    if to_render:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(render_series_pages, *series) for series in to_render
+            ]
+            for future in futures:
+                future.result()
 
-            # Use the mean of each sanitize dataset here, we do not care for
-            # variance for ratio. At least not yet.
-            y_data = [mean(sanitize_dataset(c[1][b_type])[0]) for c in results]
-            fig = plt.figure(figsize=(width, 8.27), dpi=100)
-            plot_ratio(branch, b_type, x_data, y_data, labels, latest_values)
-            pdf_pages.savefig(fig)
+    # The PDF document
+    writer = PdfWriter()
+    for path in page_paths:
+        writer.append(path)
+    # Each page file embeds its own copy of the fonts.
+    writer.compress_identical_objects()
+    with open(report_name, "wb") as report:
+        writer.write(report)
+
+    # Drop the cached pages which are not part of the report anymore.
+    for entry in os.listdir(page_dir):
+        path = os.path.join(page_dir, entry)
+        if path not in page_paths:
+            os.remove(path)
+
+
+def get_report_data(branch_results, commit_info=None, series_stats=None):
+    """
+    Return the per commit statistics of every series as a json serializable
+    dictionary. Values are rounded to 6 significant digits and missing values
+    are None. The commit dates and subjects are included when commit_info
+    (see get_git_history()) is given. The statistics of the series are
+    computed unless given, see get_series_stats().
+    """
+    if series_stats is None:
+        series_stats = get_series_stats(branch_results)
+
+    def compact(values):
+        return [None if math.isnan(v) else float("{:.6g}".format(v)) for v in values]
+
+    data = {
+        "version": 1,
+        "benchmark_types": BENCHMARK_TYPES,
+        "titles": BENCHMARK_TYPE_TITLES,
+        "counter_titles": COUNTER_METRIC_TITLES,
+        "branches": {},
+    }
+    for branch, results in branch_results.items():
+        series = {}
+        for b_type in BENCHMARK_TYPES:
+            stats = series_stats[(branch, b_type)]
+            series[b_type] = {
+                "mean": compact(stats.mean),
+                "median": compact(stats.median),
+                "ci": compact(stats.ci),
+                "count": [int(c) for c in stats.count],
+            }
+            counters = get_series_counters([c[2][b_type] for c in results])
+            for metric, values in counters.items():
+                series[b_type][metric] = compact(values)
+        data["branches"][branch] = {
+            "color": graph_get_color(branch),
+            "commits": [c[0] for c in results],
+            "series": series,
+        }
+        if commit_info:
+            infos = [commit_info.get(c[0], {}) for c in results]
+            data["branches"][branch]["dates"] = [i.get("date") for i in infos]
+            data["branches"][branch]["subjects"] = [i.get("subject") for i in infos]
+    return data
+
+
+def generate_json_report(
+    branch_results, report_name, commit_info=None, series_stats=None
+):
+    """
+    Save the per commit statistics of every series in compact json format.
+    """
+    with open(report_name, "w") as out:
+        json.dump(
+            get_report_data(branch_results, commit_info, series_stats),
+            out,
+            separators=(",", ":"),
+        )
 
-            fig = plt.figure(figsize=(width, 8.27), dpi=100)
-            plot_delta_between_point(
-                branch, b_type, x_data, y_data, labels, latest_values
+
+def generate_html_report(
+    branch_results, report_name, commit_info=None, series_stats=None
+):
+    """
+    Generate a standalone html report embedding the per commit statistics and
+    plotting them client side.
+    """
+    data = json.dumps(
+        get_report_data(branch_results, commit_info, series_stats),
+        separators=(",", ":"),
+    )
+    jinja_loader = FileSystemLoader(os.path.dirname(os.path.realpath(__file__)))
+    jinja_env = Environment(loader=jinja_loader)
+    jinja_template = jinja_env.get_template("template_report.html.jinja2")
+    with open(report_name, "w") as out:
+        # Do not let the data close the script element.
+        out.write(jinja_template.render(data=data.replace("</", "<\\/")))
+
+
+def mann_whitney_u(before, after):
+    """
+    Two-sided Mann-Whitney U test using the normal approximation with tie and
+    continuity corrections. Return the U statistic of `after` and the p-value.
+    """
+    n1 = len(before)
+    n2 = len(after)
+    combined = numpy.concatenate((before, after))
+    # Average the ranks of tied values.
+    values, inverse, counts = numpy.unique(
+        combined, return_inverse=True, return_counts=True
+    )
+    ranks = (numpy.cumsum(counts) - (counts - 1) / 2.0)[inverse]
+    u = ranks[n1:].sum() - n2 * (n2 + 1) / 2.0
+
+    n = n1 + n2
+    mu = n1 * n2 / 2.0
+    tie_term = (counts**3 - counts).sum() / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return u, 1.0
+    z = max(abs(u - mu) - 0.5, 0) / sigma
+    return u, math.erfc(z / math.sqrt(2))
+
+
+def detect_change_points(
+    commits,
+    series_stats,
+    window=DEFAULT_CP_WINDOW,
+    alpha=DEFAULT_CP_ALPHA,
+    min_effect=DEFAULT_CP_MIN_EFFECT,
+):
+    """
+    Find the commits where the performance of a series changed.
+
+    For each commit, the inlier samples of the `window` previous commits are
+    compared to those of the commit and the `window - 1` following ones
+    using a Mann-Whitney U test. A commit is reported when the difference
+    is significant (p-value < alpha), the relative change of the median is
+    at least min_effect, and it is the most significant candidate within
+    the window.
+
+    Return a list of dictionaries ordered by commit, the effect is positive
+    when the benchmark got slower.
+    """
+    rows = [
+        series_stats.samples[i][series_stats.inliers[i]] for i in range(len(commits))
+    ]
+    candidates = []
+    for pos in range(1, len(commits)):
+        before = numpy.concatenate(rows[max(0, pos - window) : pos])
+        after = numpy.concatenate(rows[pos : pos + window])
+        if len(before) < 3 or len(after) < 3:
+            continue
+        u, p_value = mann_whitney_u(before, after)
+        median_before = numpy.median(before)
+        median_after = numpy.median(after)
+        effect = (median_after / median_before) - 1.0
+        if p_value >= alpha or abs(effect) < min_effect:
+            continue
+        candidates.append(
+            {
+                "commit": commits[pos],
+                "previous_commit": commits[pos - 1],
+                "position": pos,
+                "effect": float(effect),
+                "p_value": float(p_value),
+                "u_statistic": float(u),
+                "median_before": float(median_before),
+                "median_after": float(median_after),
+            }
+        )
+
+    # Only keep the most significant candidate of each neighbourhood.
+    suspects = []
+    for candidate in candidates:
+        neighbours = [
+            c for c in candidates if abs(c["position"] - candidate["position"]) < window
+        ]
+        best = min(neighbours, key=lambda c: (c["p_value"], -abs(c["effect"])))
+        if best is candidate:
+            suspects.append(candidate)
+    return suspects
+
+
+def detect_regressions(
+    branch_results,
+    output,
+    window=DEFAULT_CP_WINDOW,
+    alpha=DEFAULT_CP_ALPHA,
+    min_effect=DEFAULT_CP_MIN_EFFECT,
+    series_stats=None,
+):
+    """
+    Run the change-point detection on every (branch, benchmark type) series
+    and save the suspect commits in json format to output. The statistics of
+    the series are computed unless given, see get_series_stats().
+    Return the list of regressions (changes making the benchmark slower).
+    """
+    if series_stats is None:
+        series_stats = get_series_stats(branch_results)
+    suspects = []
+    for branch, results in branch_results.items():
+        commits = [c[0] for c in results]
+        for b_type in BENCHMARK_TYPES:
+            stats = series_stats[(branch, b_type)]
+            for suspect in detect_change_points(
+                commits, stats, window, alpha, min_effect
+            ):
+                suspect["branch"] = branch
+                suspect["benchmark_type"] = b_type
+                suspect["kind"] = (
+                    "regression" if suspect["effect"] > 0 else "improvement"
+                )
+                del suspect["position"]
+                suspects.append(suspect)
+
+    with open(output, "w") as out:
+        json.dump(suspects, out, sort_keys=True, indent=4)
+
+    regressions = [s for s in suspects if s["kind"] == "regression"]
+    for suspect in suspects:
+        print(
+            "{} on {} for {} at {}: {:+.2%} (p-value {:.2g})".format(
+                suspect["kind"].capitalize(),
+                suspect["branch"],
+                suspect["benchmark_type"],
+                suspect["commit"][:8],
+                suspect["effect"],
+                suspect["p_value"],
             )
-            pdf_pages.savefig(fig)
+        )
+    return regressions
 
-    pdf_pages.close()
 
+def select_bisect_commits(commits, means, sample_step, threshold, failed=()):
+    """
+    Select the commits to benchmark next when bisecting. `commits` is the
+    ordered (older to newer) list of commits of a branch and `means` holds
+    the mean of each benchmark type for the commits with valid results.
+
+    Every sample_step-th commit and the branch head are benchmarked first.
+    Then, between each pair of consecutive benchmarked commits, the commit in
+    the middle is selected when the mean of any benchmark type moved by more
+    than threshold (relative change), converging on the commits responsible
+    for the changes.
+
+    The failed commits, which did not produce valid results after being
+    benchmarked too many times, are never selected: the closest commit to
+    the middle of an interval which did not fail is selected instead.
+    """
+    selected = []
+    for pos, commit in enumerate(commits):
+        if pos % sample_step and pos != len(commits) - 1:
+            continue
+        if commit not in means and commit not in failed:
+            selected.append(commit)
 
-def launch_jobs(
-    branches,
-    bt_repo_path,
-    wait_for_completion,
-    debug,
-    force,
+    tested = [pos for pos, commit in enumerate(commits) if commit in means]
+    for before, after in zip(tested, tested[1:]):
+        if after - before < 2:
+            continue
+        before_means = means[commits[before]]
+        after_means = means[commits[after]]
+        if any(
+            abs((after_means[b_type] / before_means[b_type]) - 1.0) > threshold
+            for b_type in BENCHMARK_TYPES
+        ):
+            middle = (before + after) // 2
+            candidates = sorted(
+                range(before + 1, after), key=lambda pos: abs(pos - middle)
+            )
+            for pos in candidates:
+                if commits[pos] not in failed:
+                    if commits[pos] not in selected:
+                        selected.append(commits[pos])
+                    break
+    return selected
+
+
+def load_bisect_attempts(path):
+    """
+    Return the number of times each commit without valid results was
+    benchmarked when bisecting, recorded in the JSON file at path.
+    """
+    if path is None:
+        return {}
+    try:
+        with open(path) as attempts:
+            return json.load(attempts)
+    except FileNotFoundError:
+        return {}
+    except ValueError as error:
+        print("Ignoring invalid bisection attempts {}: {}".format(path, error))
+        return {}
+
+
+def save_bisect_attempts(path, attempts):
+    if path is None:
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as out:
+        json.dump(attempts, out)
+    os.replace(tmp_path, path)
+
+
+def submit_jobs(
+    commits_to_test,
     batch_size,
     max_batches,
     bt_repo,
     ci_repo,
     ci_branch,
     nfs_root_url,
+    wait_for_completion,
+    debug,
+    max_in_flight=None,
+    durations=None,
+    target_job_hours=0,
 ):
     """
-    Lauch jobs for all missing results.
+    Submit the commits to lava in batches of batch_size commits, up to
+    max_batches batches. Return the batches submitted.
+
+    When durations (a job_durations.JobDurations) is set, the per-commit
+    durations of the jobs waited for are recorded and used to compute the
+    job timeouts. If target_job_hours is also set, the batches are sized so
+    that each job lasts about target_job_hours hours.
+
+    When waiting for completion and max_in_flight (a dictionary of the form
+    {device_tag: max_jobs}) is set, several batches are kept in flight at
+    once, see lava_submit.submit_window(). Otherwise batches are submitted
+    one after the other.
     """
-    client = get_client()
-    commits_to_test = set()
-    for branch, cutoff in branches.items():
-        commits = [
-            x for x in get_git_log(branch, cutoff, bt_repo_path) if x not in invalid_commits
-        ]
-        with tempfile.TemporaryDirectory() as workdir:
-            for commit in commits:
-                if get_benchmark_results(client, commit, workdir)[1] and not force:
-                    print("All benchmarks are valid for {}, skipping".format(commit))
-                    continue
-                commits_to_test.add(commit)
-
-    commits_to_test = list(commits_to_test)
-    print("{} commits to run benchmarks for".format(len(commits_to_test)))
-    if len(commits_to_test) == 0:
-        return
+    if durations is not None and target_job_hours > 0:
+        adaptive_size = durations.batch_size(
+            lava_submit.DEFAULT_DEVICE_TAG, target_job_hours * 3600
+        )
+        if adaptive_size is None:
+            print(
+                "Not enough job durations recorded, using batches of {} commits".format(
+                    batch_size
+                )
+            )
+        else:
+            print(
+                "Using batches of {} commits for jobs of {} hours".format(
+                    adaptive_size, target_job_hours
+                )
+            )
+            batch_size = adaptive_size
 
     chunks = [commits_to_test]
     batches_run = 0
@@ -479,6 +1374,19 @@ def launch_jobs(
             for i in range(0, len(commits_to_test), batch_size)
         ]
 
+    if max_in_flight and wait_for_completion:
+        if max_batches > 0:
+            chunks = chunks[:max_batches]
+        job_definitions = lava_submit.render_many(
+            chunks, bt_repo, ci_repo, ci_branch, nfs_root_url, durations=durations
+        )
+        jobs = [
+            (lava_submit.DEFAULT_DEVICE_TAG, job_definition)
+            for job_definition in job_definitions
+        ]
+        lava_submit.submit_window(jobs, max_in_flight, debug=debug, durations=durations)
+        return chunks
+
     for index, commits in enumerate(chunks):
         print("Job {}/{}".format(index + 1, max(len(chunks), max_batches)))
         lava_submit.submit(
@@ -489,10 +1397,144 @@ def launch_jobs(
             nfs_root_url,
             wait_for_completion=wait_for_completion,
             debug=debug,
+            durations=durations if wait_for_completion else None,
         )
         batches_run += 1
         if max_batches > 0 and batches_run >= max_batches:
             break
+    return chunks[:batches_run]
+
+
+def launch_jobs(
+    branches,
+    bt_repo_path,
+    wait_for_completion,
+    debug,
+    force,
+    batch_size,
+    max_batches,
+    bt_repo,
+    ci_repo,
+    ci_branch,
+    nfs_root_url,
+    fetch_jobs=DEFAULT_FETCH_JOBS,
+    cache=None,
+    validate_cache=False,
+    use_index=True,
+    history_file=None,
+    schedule="all",
+    sample_step=DEFAULT_BISECT_SAMPLE_STEP,
+    bisect_threshold=DEFAULT_BISECT_THRESHOLD,
+    bisect_rounds=DEFAULT_BISECT_ROUNDS,
+    attempts_file=None,
+    bisect_max_attempts=DEFAULT_BISECT_MAX_ATTEMPTS,
+    max_in_flight=None,
+    durations=None,
+    target_job_hours=0,
+):
+    """
+    Lauch jobs for all missing results.
+
+    With the "bisect" schedule, only a sample of the commits is benchmarked
+    and the intervals where the results moved are bisected, see
+    select_bisect_commits(). When waiting for the completion of the jobs, up
+    to bisect_rounds rounds of bisection are run, otherwise the next
+    invocation carries on from the results uploaded in the meantime. The
+    commits benchmarked bisect_max_attempts times without producing valid
+    results (e.g. which do not build) are skipped, the attempts are recorded
+    in attempts_file, when set, to carry over to the next invocations.
+    """
+    client = get_client(pool_size=fetch_jobs)
+    branch_commits = get_git_history(branches, bt_repo_path, history_file)[0]
+    rounds = 1
+    if schedule == "bisect" and wait_for_completion and not force and not debug:
+        rounds = bisect_rounds
+    batches_run = 0
+    attempts = load_bisect_attempts(attempts_file)
+
+    for bisect_round in range(rounds):
+        index = None
+        if use_index and not force:
+            index = load_result_index(client)
+        commits_to_test = []
+        for branch, commits in branch_commits.items():
+            commits = [x for x in commits if x not in invalid_commits]
+            if force:
+                commits_to_test.extend(commits)
+                continue
+            if index is not None:
+                # Only the complete results need to be downloaded to be checked.
+                missing = [x for x in commits if not is_result_complete(index, x)]
+                print(
+                    "Branch {}: {} commits with missing results, {} to check".format(
+                        branch, len(missing), len(commits) - len(missing)
+                    )
+                )
+            valid_results = []
+            for commit, results, valid, counters in fetch_benchmark_results(
+                client, commits, cache, fetch_jobs, validate_cache, index
+            ):
+                if valid:
+                    print("All benchmarks are valid for {}, skipping".format(commit))
+                    valid_results.append((commit, results, counters))
+                    attempts.pop(commit, None)
+                    continue
+                if schedule != "bisect":
+                    commits_to_test.append(commit)
+
+            if schedule == "bisect":
+                # The results change from round to round, the statistics of
+                # the series are computed once per round.
+                series_stats = get_series_stats({branch: valid_results})
+                means = {
+                    commit: {
+                        b_type: float(series_stats[(branch, b_type)].mean[pos])
+                        for b_type in BENCHMARK_TYPES
+                    }
+                    for pos, (commit, _, _) in enumerate(valid_results)
+                }
+                failed = set(
+                    commit
+                    for commit, count in attempts.items()
+                    if count >= bisect_max_attempts
+                )
+                selected = select_bisect_commits(
+                    commits, means, sample_step, bisect_threshold, failed
+                )
+                print(
+                    "Branch {}: bisection round {} selected {} commits".format(
+                        branch, bisect_round + 1, len(selected)
+                    )
+                )
+                commits_to_test.extend(selected)
+
+        # A commit can be part of many branches.
+        commits_to_test = list(dict.fromkeys(commits_to_test))
+        print("{} commits to run benchmarks for".format(len(commits_to_test)))
+        if len(commits_to_test) == 0:
+            return
+
+        batches = submit_jobs(
+            commits_to_test,
+            batch_size,
+            max_batches - batches_run if max_batches > 0 else 0,
+            bt_repo,
+            ci_repo,
+            ci_branch,
+            nfs_root_url,
+            wait_for_completion,
+            debug,
+            max_in_flight,
+            durations,
+            target_job_hours,
+        )
+        batches_run += len(batches)
+        if schedule == "bisect" and not debug:
+            for commit in [c for batch in batches for c in batch]:
+                attempts[commit] = attempts.get(commit, 0) + 1
+            save_bisect_attempts(attempts_file, attempts)
+        if max_batches > 0 and batches_run >= max_batches:
+            return
 
 
 def main():
@@ -516,6 +1558,14 @@ def main():
         help="When generating jobs, run up to N commits per job. When set to 0, run all commits in a single job",
         default=100,
     )
+    parser.add_argument(
+        "--target-job-hours",
+        type=float,
+        default=0,
+        help="When generating jobs, size the batches from the durations of the "
+        "previous jobs so that each job lasts about N hours. Falls back to "
+        "--batch-size until enough durations are recorded. Needs the cache.",
+    )
     parser.add_argument(
         "--max-batches",
         type=int,
@@ -525,6 +1575,59 @@ def main():
     parser.add_argument(
         "--force-jobs", action="store_true", help="Force the queueing of jobs to lava"
     )
+    parser.add_argument(
+        "--schedule",
+        choices=["all", "bisect"],
+        default="all",
+        help="Benchmark all the commits missing results, or only a sample of them and "
+        "bisect the intervals where the results moved (default: all)",
+    )
+    parser.add_argument(
+        "--bisect-sample-step",
+        type=int,
+        default=DEFAULT_BISECT_SAMPLE_STEP,
+        help="When bisecting, first benchmark every N commits and the branch heads (default: {})".format(
+            DEFAULT_BISECT_SAMPLE_STEP
+        ),
+    )
+    parser.add_argument(
+        "--bisect-threshold",
+        type=float,
+        default=DEFAULT_BISECT_THRESHOLD,
+        help="When bisecting, relative change of the mean between two benchmarked "
+        "commits above which the interval is bisected (default: {})".format(
+            DEFAULT_BISECT_THRESHOLD
+        ),
+    )
+    parser.add_argument(
+        "--bisect-rounds",
+        type=int,
+        default=DEFAULT_BISECT_ROUNDS,
+        help="When bisecting and waiting on the jobs, maximum number of bisection "
+        "rounds (default: {})".format(DEFAULT_BISECT_ROUNDS),
+    )
+    parser.add_argument(
+        "--bisect-max-attempts",
+        type=int,
+        default=DEFAULT_BISECT_MAX_ATTEMPTS,
+        help="When bisecting, skip the commits which did not produce valid "
+        "results after being benchmarked N times (default: {})".format(
+            DEFAULT_BISECT_MAX_ATTEMPTS
+        ),
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=1,
+        help="When waiting on the jobs, keep up to N jobs submitted or running at "
+        "once on each device tag (default: 1)",
+    )
+    parser.add_argument(
+        "--max-in-flight-per-tag",
+        type=json_type,
+        help="A dictionary of the form {'device_tag': N,...} overriding "
+        "--max-in-flight for specific device tags.",
+    )
     parser.add_argument(
         "--do-not-wait-on-completion",
         action="store_true",
@@ -540,11 +1643,60 @@ def main():
     parser.add_argument(
         "--report-name", default="report.pdf", help="The name of the pdf report."
     )
+    parser.add_argument(
+        "--report-format",
+        action="append",
+        choices=REPORT_FORMATS,
+        help="Format of the report, can be repeated (default: pdf). The html "
+        "and json reports are named after the pdf report with their own extension.",
+    )
+    parser.add_argument(
+        "--detect-regressions",
+        action="store_true",
+        help="Run the change-point detection and save the suspect commits to json",
+    )
+    parser.add_argument(
+        "--regressions-output",
+        default="regressions.json",
+        help="Where to save the suspect commits (default: regressions.json)",
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        default=False,
+        help="Exit with a non-zero status when a regression is detected.",
+    )
+    parser.add_argument(
+        "--cp-window",
+        type=int,
+        default=DEFAULT_CP_WINDOW,
+        help="Number of commits compared on each side of a change point (default: {})".format(
+            DEFAULT_CP_WINDOW
+        ),
+    )
+    parser.add_argument(
+        "--cp-alpha",
+        type=float,
+        default=DEFAULT_CP_ALPHA,
+        help="Significance level of a change point (default: {})".format(
+            DEFAULT_CP_ALPHA
+        ),
+    )
+    parser.add_argument(
+        "--cp-min-effect",
+        type=float,
+        default=DEFAULT_CP_MIN_EFFECT,
+        help="Minimal relative change of the median of a change point (default: {})".format(
+            DEFAULT_CP_MIN_EFFECT
+        ),
+    )
     parser.add_argument(
         "--debug", action="store_true", default=False, help="Do not send jobs to lava."
     )
     parser.add_argument(
-        "--bt-repo-path", help="The location of the babeltrace git repo to use.", required=True
+        "--bt-repo-path",
+        help="The location of the babeltrace git repo to use.",
+        required=True,
     )
     parser.add_argument(
         "--overwrite-branches-cutoff",
@@ -564,12 +1716,100 @@ def main():
     )
     parser.add_argument("--ci-branch", default="master")
     parser.add_argument("--nfs-root-url", default=os.getenv("NFS_ROOT_URL"))
+    parser.add_argument(
+        "--fetch-jobs",
+        type=int,
+        default=DEFAULT_FETCH_JOBS,
+        help="Number of concurrent downloads when fetching results from S3 (default: {})".format(
+            DEFAULT_FETCH_JOBS
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=result_cache.DEFAULT_CACHE_DIR,
+        help="Where to keep the local cache of downloaded results (default: {})".format(
+            result_cache.DEFAULT_CACHE_DIR
+        ),
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        type=int,
+        default=result_cache.DEFAULT_MAX_SIZE // (1024 * 1024),
+        help="Maximum size of the result cache in MiB (default: {})".format(
+            result_cache.DEFAULT_MAX_SIZE // (1024 * 1024)
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Do not use the local result cache, always download from S3.",
+    )
+    parser.add_argument(
+        "--validate-cache",
+        action="store_true",
+        default=False,
+        help="Check the ETag of cached results against S3 before using them.",
+    )
+    parser.add_argument(
+        "--no-result-index",
+        action="store_true",
+        default=False,
+        help="Do not list the available results beforehand, request each result individually.",
+    )
+    parser.add_argument(
+        "--render-jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of processes rendering the report pages (default: {})".format(
+            os.cpu_count()
+        ),
+    )
 
     args = parser.parse_args()
     if args.batch_size < 0:
         print("Batch size must be greater than or equal to 0")
         return 1
 
+    if args.fetch_jobs < 1:
+        print("Fetch jobs must be greater than 0")
+        return 1
+
+    if args.max_in_flight < 1:
+        print("Max in flight must be greater than 0")
+        return 1
+
+    if args.bisect_sample_step < 1:
+        print("Bisection sample step must be greater than 0")
+        return 1
+
+    if args.bisect_max_attempts < 1:
+        print("Bisection max attempts must be greater than 0")
+        return 1
+
+    if args.target_job_hours < 0:
+        print("Target job hours must be greater than or equal to 0")
+        return 1
+
+    if 0 < args.target_job_hours * 3600 <= job_durations.JOB_OVERHEAD:
+        print(
+            "Target job hours must be greater than the job overhead of {} hours".format(
+                job_durations.JOB_OVERHEAD / 3600
+            )
+        )
+        return 1
+
+    if args.render_jobs < 1:
+        print("Render jobs must be greater than 0")
+        return 1
+
+    if args.cp_window < 1:
+        print("Change-point window must be greater than 0")
+        return 1
+
+    if not args.report_format:
+        args.report_format = ["pdf"]
+
     if args.overwrite_branches_cutoff:
         bt_branches = args.overwrite_branches_cutoff
 
@@ -577,6 +1817,25 @@ def main():
         print("Repository location does not exists.")
         return 1
 
+    cache = None
+    history_file = None
+    durations = None
+    attempts_file = None
+    if not args.no_cache:
+        cache = result_cache.ResultCache(
+            args.cache_dir, args.cache_max_size * 1024 * 1024
+        )
+        history_file = os.path.join(args.cache_dir, "git-history.json")
+        durations = job_durations.JobDurations(
+            os.path.join(args.cache_dir, "job-durations.json")
+        )
+        attempts_file = os.path.join(args.cache_dir, "bisect-attempts.json")
+
+    max_in_flight = None
+    if args.max_in_flight > 1 or args.max_in_flight_per_tag:
+        max_in_flight = {"default": args.max_in_flight}
+        max_in_flight.update(args.max_in_flight_per_tag or {})
+
     if args.generate_jobs:
         print("Launching jobs for:")
 
@@ -595,36 +1854,81 @@ def main():
             args.ci_repo,
             args.ci_branch,
             args.nfs_root_url,
+            args.fetch_jobs,
+            cache,
+            args.validate_cache,
+            not args.no_result_index,
+            history_file,
+            args.schedule,
+            args.bisect_sample_step,
+            args.bisect_threshold,
+            args.bisect_rounds,
+            attempts_file,
+            args.bisect_max_attempts,
+            max_in_flight,
+            durations,
+            args.target_job_hours,
+        )
+
+    branch_results = None
+    series_stats = None
+    if args.generate_report or args.detect_regressions:
+        branch_results = get_branch_results(
+            bt_branches,
+            args.bt_repo_path,
+            args.fetch_jobs,
+            cache,
+            args.validate_cache,
+            not args.no_result_index,
+            history_file,
         )
+        # Shared by all the reports and the regression detection.
+        series_stats = get_series_stats(branch_results)
 
-    if args.generate_report:
-        print("Generating pdf report ({}) for:".format(args.report_name))
+    if cache:
+        cache.close()
+
+    for report_format in args.report_format if args.generate_report else []:
+        report_name = args.report_name
+        if report_format != "pdf":
+            report_name = "{}.{}".format(
+                os.path.splitext(args.report_name)[0], report_format
+            )
+        print("Generating {} report ({}) for:".format(report_format, report_name))
         for branch, cutoff in bt_branches.items():
             print("\t Branch {} with cutoff {}".format(branch, cutoff))
-        generate_graph(bt_branches, args.report_name, args.bt_repo_path)
-
-    return 0
+        commit_info = get_git_history(bt_branches, args.bt_repo_path, history_file)[1]
+        if report_format == "json":
+            generate_json_report(branch_results, report_name, commit_info, series_stats)
+        elif report_format == "html":
+            generate_html_report(branch_results, report_name, commit_info, series_stats)
+        else:
+            page_dir = None
+            if not args.no_cache:
+                page_dir = os.path.join(args.cache_dir, "pages")
+            generate_graph(
+                branch_results, report_name, page_dir, args.render_jobs, series_stats
+            )
 
+    if args.detect_regressions:
+        print(
+            "Detecting regressions, saving suspects to {}".format(
+                args.regressions_output
+            )
+        )
+        regressions = detect_regressions(
+            branch_results,
+            args.regressions_output,
+            args.cp_window,
+            args.cp_alpha,
+            args.cp_min_effect,
+            series_stats,
+        )
+        print("{} regressions detected".format(len(regressions)))
+        if regressions and args.fail_on_regression:
+            return 1
 
-def sanitize_dataset(dataset):
-    """
-    Use IRQ 1.5 [1] to remove outlier from the dataset. This is useful to get a
-    representative mean without outlier in it.
-    [1] https://en.wikipedia.org/wiki/Interquartile_range#Outliers
-    """
-    sorted_data = sorted(dataset)
-    q1, q3 = numpy.percentile(sorted_data, [25, 75])
-    iqr = q3 - q1
-    lower_bound = q1 - (1.5 * iqr)
-    upper_bound = q3 + (1.5 * iqr)
-    new_dataset = []
-    outliers = []
-    for i in dataset:
-        if lower_bound <= i <= upper_bound:
-            new_dataset.append(i)
-        else:
-            outliers.append(i)
-    return new_dataset, outliers
+    return 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+# SPDX-FileCopyrightText: 2026 EfficiOS Inc.
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import math
+import os
+import re
+import time
+
+import numpy
+
+# Number of per-commit durations kept for each device tag
+MAX_RECORDS = 500
+
+# Number of per-commit durations needed before trusting the estimate
+MIN_RECORDS = 5
+
+# Quantile of the per-commit durations used as the estimate
+ESTIMATE_QUANTILE = 0.9
+
+# Time spent deploying, booting and setting up the board, in seconds
+JOB_OVERHEAD = 30 * 60
+
+# Safety factor applied to the estimated duration of a job for its timeout
+TIMEOUT_MARGIN = 1.5
+
+# Minimal job timeout, the timeout of the jobs without history
+MIN_TIMEOUT_MINUTES = 3 * 60
+
+# Line printed by lava/babeltrace-benchmark/benchmark.sh after each commit
+DURATION_RE = re.compile(
+    r"^BENCHMARK_DURATION commit=(?P<commit>\w+) build=(?P<build>\d+) benchmark=(?P<benchmark>\d+)$"
+)
+
+
+class DurationCollector:
+    """
+    LAVA log entry callback collecting the per-commit build and benchmark
+    durations printed by the benchmark job.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, entry):
+        if entry.get("lvl") != "target" or not isinstance(entry.get("msg"), str):
+            return
+        match = DURATION_RE.match(entry["msg"].strip())
+        if match:
+            self.records.append(
+                {
+                    "commit": match.group("commit"),
+                    "build": int(match.group("build")),
+                    "benchmark": int(match.group("benchmark")),
+                }
+            )
+
+
+class JobDurations:
+    """
+    History of the per-commit build and benchmark durations of the finished
+    benchmark jobs, by device tag, stored as a JSON file. It is used to size
+    the batches of commits to a target duration and to compute their
+    timeouts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        try:
+            with open(path) as history:
+                self.records = json.load(history)
+        except FileNotFoundError:
+            pass
+        except ValueError as error:
+            print("Ignoring invalid job durations history {}: {}".format(path, error))
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as out:
+            json.dump(self.records, out)
+        os.replace(tmp_path, self.path)
+
+    def record(self, device_tag, records):
+        """
+        Add the per-commit durations of a finished job. The records without
+        duration, of the commits which failed or were not benchmarked, are
+        ignored.
+        """
+        records = [r for r in records if r["build"] + r["benchmark"] > 0]
+        if not records:
+            return
+        now = time.time()
+        tag_records = self.records.setdefault(device_tag, [])
+        tag_records.extend(dict(record, time=now) for record in records)
+        del tag_records[:-MAX_RECORDS]
+        self.save()
+
+    def estimate(self, device_tag):
+        """
+        Return the estimated duration, in seconds, of the build and benchmark
+        of one commit on the boards of a device tag. None if there is not
+        enough history.
+        """
+        durations = [
+            r["build"] + r["benchmark"]
+            for r in self.records.get(device_tag, [])
+            if r["build"] + r["benchmark"] > 0
+        ]
+        if len(durations) < MIN_RECORDS:
+            return None
+        return float(numpy.quantile(durations, ESTIMATE_QUANTILE))
+
+    def batch_size(self, device_tag, target_seconds):
+        """
+        Return the number of commits fitting in a job of target_seconds
+        seconds, None if the duration of a commit can't be estimated.
+        target_seconds must be greater than JOB_OVERHEAD.
+        """
+        if target_seconds <= JOB_OVERHEAD:
+            raise ValueError(
+                "The target duration of a job must be greater than {} seconds".format(
+                    JOB_OVERHEAD
+                )
+            )
+        estimate = self.estimate(device_tag)
+        if estimate is None:
+            return None
+        return max(1, int((target_seconds - JOB_OVERHEAD) // estimate))
+
+    def timeout_minutes(self, device_tag, commit_count):
+        """
+        Return the timeout of a job benchmarking commit_count commits, at
+        least MIN_TIMEOUT_MINUTES, None if the duration of a commit can't be
+        estimated.
+        """
+        estimate = self.estimate(device_tag)
+        if estimate is None:
+            return None
+        return max(
+            MIN_TIMEOUT_MINUTES,
+            math.ceil((JOB_OVERHEAD + commit_count * estimate) * TIMEOUT_MARGIN / 60),
+        )
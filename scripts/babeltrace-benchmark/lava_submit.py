@@ -3,13 +3,19 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import argparse
+import asyncio
 import math
 import os
 import sys
 import time
 import xmlrpc.client
 
-from jinja2 import Environment, FileSystemLoader
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common")
+)
+import job_durations
+import lava_client
+import lava_job
 
 # 4.4.194
 DEFAULT_KERNEL_COMMIT = "a227f8436f2b21146fc024d84e6875907475ace2"
@@ -32,6 +38,17 @@ TRACE_TOOLS_2_10_LOCATION = "https://obj-lava.internal.efficios.com/traces/bench
 TRACE_TOOLS_2_14_LOCATION = "https://obj-lava.internal.efficios.com/traces/benchmark/babeltrace/babeltrace_benchmark_trace-tools-2.14.tar.gz"
 
 
+# Device tag of the boards running the benchmark
+DEFAULT_DEVICE_TAG = "dev-sda1"
+
+# Number of attempts to submit a job and delay between them, in seconds
+SUBMIT_ATTEMPTS = 10
+SUBMIT_RETRY_DELAY = 5
+
+TEMPLATE_DIR = os.path.dirname(os.path.realpath(__file__))
+TEMPLATE_NAME = "template_lava_job_bt_benchmark.yml.jinja2"
+
+
 def wait_on(server, jobid):
     """
     Wait for the completion of the job.
@@ -39,61 +56,74 @@ def wait_on(server, jobid):
     multiple jobs for the same commit hash. Jenkins is responsible for
     running only one job for job submissions.
     """
-    # Check the status of the job every 30 seconds
-    jobstatus = server.scheduler.job_state(jobid)["job_state"]
-    running = False
-    while jobstatus in ["Submitted", "Scheduling", "Scheduled", "Running"]:
-        if not running and jobstatus == "Running":
-            print("Job started running", flush=True)
-            running = True
-        time.sleep(30)
-        try:
-            jobstatus = server.scheduler.job_state(jobid)["job_state"]
-        except xmlrpc.client.ProtocolError:
-            print("Protocol error, retrying", flush=True)
-            continue
-    print("Job ended with {} status.".format(jobstatus), flush=True)
+    lava_client.wait_for_job(server, jobid)
 
 
-def submit(
+def record_durations(server, jobid, device_tag, durations):
+    """
+    Record the per-commit durations printed in the log of a finished job.
+    """
+    collector = job_durations.DurationCollector()
+    lava_client.read_logs(server, jobid, collector)
+    durations.record(device_tag, collector.records)
+
+
+def get_lava_api_key(debug=False):
+    """
+    Return the lava API key from the environment, None in debug mode or if
+    it is not set.
+    """
+    if debug:
+        return None
+    try:
+        return os.environ["LAVA2_JENKINS_TOKEN"]
+    except Exception as error:
+        print(
+            "LAVA2_JENKINS_TOKEN not found in the environment variable. Exiting...",
+            error,
+        )
+        return None
+
+
+def get_server(lava_api_key):
+    """
+    Return a lava XML-RPC server proxy.
+    """
+    return lava_client.get_server(LAVA_PROTO, LAVA_USERNAME, lava_api_key, LAVA_HOST)
+
+
+def get_context(
     commits,
     bt_repo,
     ci_repo,
     ci_branch,
     nfsrootfs,
-    debug=False,
     kernel_commit=DEFAULT_KERNEL_COMMIT,
-    wait_for_completion=True,
+    device_tag=DEFAULT_DEVICE_TAG,
+    timeout_minutes=None,
 ):
-    kernel_url = (
-        "{}/system-tests/kernel/{}.baremetal.bzImage".format(
-            S3_HTTP_BUCKET_URL,
-            kernel_commit
-        )
+    """
+    Return the context of the lava job template benchmarking the commits.
+    Without timeout_minutes, the job timeout is 1.5 hours per commit with a
+    minimum of 3 hours.
+    """
+    kernel_url = "{}/system-tests/kernel/{}.baremetal.bzImage".format(
+        S3_HTTP_BUCKET_URL, kernel_commit
     )
 
-    # Get the S3 secret from the environment
-    lava_api_key = None
-    if not debug:
-        try:
-            lava_api_key = os.environ["LAVA2_JENKINS_TOKEN"]
-        except Exception as error:
-            print(
-                "LAVA2_JENKINS_TOKEN not found in the environment variable. Exiting...",
-                error,
-            )
-            return -1
-
     # Context for the lava job template
     context = dict()
     context["kernel_url"] = kernel_url
     context["nfsrootfs_url"] = nfsrootfs
     context["commit_hashes"] = " ".join(commits)
+    context["device_tag"] = device_tag
 
     context["ci_repo"] = ci_repo
     context["ci_branch"] = ci_branch
 
-    context["job_timeout_hours"] = max(3, math.ceil(len(commits) * 1.5))
+    if timeout_minutes is None:
+        timeout_minutes = max(3, math.ceil(len(commits) * 1.5)) * 60
+    context["job_timeout_minutes"] = timeout_minutes
     context["bt_repo"] = bt_repo
 
     context["trace_default_location"] = TRACE_DEFAULT_LOCATION
@@ -106,50 +136,242 @@ def submit(
     context["s3_host"] = S3_HOST
     context["s3_bucket"] = S3_BUCKET
     context["s3_base_dir"] = S3_BASE_DIR
+    return context
 
-    # Render the lava job template
-    jinja_loader = FileSystemLoader(os.path.dirname(os.path.realpath(__file__)))
-    jinja_env = Environment(loader=jinja_loader, trim_blocks=True, lstrip_blocks=True)
-    jinja_template = jinja_env.get_template("template_lava_job_bt_benchmark.yml.jinja2")
-    render = jinja_template.render(context)
 
-    print("Job to be submitted:", flush=True)
-
-    print(render, flush=True)
+def render(
+    commits,
+    bt_repo,
+    ci_repo,
+    ci_branch,
+    nfsrootfs,
+    kernel_commit=DEFAULT_KERNEL_COMMIT,
+    device_tag=DEFAULT_DEVICE_TAG,
+    durations=None,
+):
+    """
+    Render the lava job definition benchmarking the commits.
+    """
+    return render_many(
+        [commits],
+        bt_repo,
+        ci_repo,
+        ci_branch,
+        nfsrootfs,
+        kernel_commit=kernel_commit,
+        device_tag=device_tag,
+        durations=durations,
+    )[0]
 
-    if debug:
-        return 0
 
-    server = xmlrpc.client.ServerProxy(
-        "%s://%s:%s@%s/RPC2" % (LAVA_PROTO, LAVA_USERNAME, lava_api_key, LAVA_HOST)
-    )
+def render_many(
+    batches,
+    bt_repo,
+    ci_repo,
+    ci_branch,
+    nfsrootfs,
+    kernel_commit=DEFAULT_KERNEL_COMMIT,
+    device_tag=DEFAULT_DEVICE_TAG,
+    durations=None,
+):
+    """
+    Render the lava job definitions benchmarking each batch of commits in one
+    pass. Raise lava_job.JobDefinitionError if a definition is invalid.
 
-    for attempt in range(10):
-        try:
-            jobid = server.scheduler.submit_job(render)
-        except xmlrpc.client.ProtocolError as error:
-            print(
-                "Protocol error on submit, sleeping and retrying. Attempt #{}".format(
-                    attempt
-                ),
-                flush=True,
+    When durations (a job_durations.JobDurations) is set, the timeout of each
+    job is computed from the recorded durations of the previous jobs.
+    """
+    contexts = []
+    for commits in batches:
+        timeout_minutes = None
+        if durations is not None:
+            timeout_minutes = durations.timeout_minutes(device_tag, len(commits))
+        contexts.append(
+            get_context(
+                commits,
+                bt_repo,
+                ci_repo,
+                ci_branch,
+                nfsrootfs,
+                kernel_commit,
+                device_tag,
+                timeout_minutes,
             )
-            time.sleep(5)
-            continue
-        else:
-            break
+        )
+    return lava_job.render_many(TEMPLATE_DIR, TEMPLATE_NAME, contexts)
+
 
+def try_submit_job(server, job_definition, attempt):
+    """
+    Submit a job definition to lava. Return the job id, None on protocol
+    errors.
+    """
+    try:
+        return server.scheduler.submit_job(job_definition)
+    except xmlrpc.client.ProtocolError:
+        print(
+            "Protocol error on submit, sleeping and retrying. Attempt #{}".format(
+                attempt
+            ),
+            flush=True,
+        )
+        return None
+
+
+def print_job(jobid):
     print("Lava jobid:{}".format(jobid), flush=True)
     print(
         "Lava job URL: https://{}/scheduler/job/{}".format(LAVA_HOST, jobid),
         flush=True,
     )
 
+
+def submit_job(server, job_definition):
+    """
+    Submit a job definition to lava, retrying on protocol errors. Return the
+    job id, None if the job could not be submitted.
+    """
+    for attempt in range(SUBMIT_ATTEMPTS):
+        jobid = try_submit_job(server, job_definition, attempt)
+        if jobid is not None:
+            break
+        time.sleep(SUBMIT_RETRY_DELAY)
+    print_job(jobid)
+    return jobid
+
+
+async def submit_job_async(lava_api_key, job_definition):
+    """
+    Like submit_job(), without blocking the event loop. Each attempt runs in
+    a thread with its own server proxy, so that it does not wait for nor
+    block the calls of a lava_client.JobWatcher, and the retries are waited
+    for with asyncio.sleep().
+    """
+    for attempt in range(SUBMIT_ATTEMPTS):
+        jobid = await asyncio.to_thread(
+            try_submit_job, get_server(lava_api_key), job_definition, attempt
+        )
+        if jobid is not None:
+            break
+        await asyncio.sleep(SUBMIT_RETRY_DELAY)
+    print_job(jobid)
+    return jobid
+
+
+def submit(
+    commits,
+    bt_repo,
+    ci_repo,
+    ci_branch,
+    nfsrootfs,
+    debug=False,
+    kernel_commit=DEFAULT_KERNEL_COMMIT,
+    wait_for_completion=True,
+    durations=None,
+):
+    # Get the S3 secret from the environment
+    lava_api_key = get_lava_api_key(debug)
+    if not debug and lava_api_key is None:
+        return -1
+
+    try:
+        job_definition = render(
+            commits,
+            bt_repo,
+            ci_repo,
+            ci_branch,
+            nfsrootfs,
+            kernel_commit=kernel_commit,
+            durations=durations,
+        )
+    except lava_job.JobDefinitionError as error:
+        print("Invalid job definition:", error, flush=True)
+        return -1
+
+    print("Job to be submitted:", flush=True)
+
+    print(job_definition, flush=True)
+
+    if debug:
+        return 0
+
+    server = get_server(lava_api_key)
+    jobid = submit_job(server, job_definition)
+    if jobid is None:
+        return -1
+
     if not wait_for_completion:
         return 0
 
     wait_on(server, jobid)
 
+    if durations is not None:
+        record_durations(server, jobid, DEFAULT_DEVICE_TAG, durations)
+
+
+def submit_window(jobs, max_in_flight, debug=False, durations=None):
+    """
+    Submit the jobs, a list of (device_tag, job_definition) tuples, keeping
+    at most max_in_flight[device_tag] jobs submitted or running at once for
+    each device tag (max_in_flight["default"] for the tags not listed). All
+    the in-flight jobs are tracked over a single connection and the next job
+    of a tag is submitted as soon as one of its jobs ends. Return once all
+    the jobs ended, the number of jobs submitted.
+
+    When durations (a job_durations.JobDurations) is set, the per-commit
+    durations of each job are recorded once it ended.
+    """
+    lava_api_key = get_lava_api_key(debug)
+    if not debug and lava_api_key is None:
+        return 0
+
+    if debug:
+        for index, (device_tag, job_definition) in enumerate(jobs):
+            print(
+                "Job {}/{} to be submitted on {}:".format(
+                    index + 1, len(jobs), device_tag
+                ),
+                flush=True,
+            )
+            print(job_definition, flush=True)
+        return len(jobs)
+
+    server = get_server(lava_api_key)
+    watcher = lava_client.JobWatcher(server)
+
+    async def run_all():
+        # Semaphores wake up their waiters in order, the jobs of a tag are
+        # submitted in order.
+        slots = {}
+        for device_tag, _ in jobs:
+            limit = max_in_flight.get(device_tag, max_in_flight.get("default", 1))
+            slots.setdefault(device_tag, asyncio.Semaphore(limit))
+
+        async def run(index, device_tag, job_definition):
+            async with slots[device_tag]:
+                print(
+                    "Job {}/{} to be submitted on {}:".format(
+                        index + 1, len(jobs), device_tag
+                    ),
+                    flush=True,
+                )
+                print(job_definition, flush=True)
+                jobid = await submit_job_async(lava_api_key, job_definition)
+                if jobid is None:
+                    return False
+                await watcher.watch(jobid)
+                if durations is not None:
+                    collector = job_durations.DurationCollector()
+                    await watcher.follow_logs(jobid, collector, 0)
+                    durations.record(device_tag, collector.records)
+                return True
+
+        return await asyncio.gather(
+            *[run(index, *job) for index, job in enumerate(jobs)]
+        )
+
+    return sum(asyncio.run(run_all()))
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+# SPDX-FileCopyrightText: 2026 EfficiOS Inc.
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# 512 MiB
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "lttng-ci",
+    "babeltrace-benchmark",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    type TEXT NOT NULL,
+    commit_hash TEXT NOT NULL,
+    etag TEXT,
+    last_modified REAL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (type, commit_hash)
+)
+"""
+
+
+class ResultCache:
+    """
+    On-disk cache of the benchmark result files, keyed by benchmark type and
+    commit hash. The content is stored compressed in a single SQLite database
+    along with the ETag and last modification date of the remote object so
+    that it can be validated against S3.
+
+    The cache is safe to share between threads.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "results.sqlite")
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+
+    def get(self, b_type, commit):
+        """
+        Return a (data, etag, last_modified) tuple for the cached result or
+        None if it is not in the cache.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, etag, last_modified FROM results "
+                "WHERE type = ? AND commit_hash = ?",
+                (b_type, commit),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE results SET accessed = ? WHERE type = ? AND commit_hash = ?",
+                (time.time(), b_type, commit),
+            )
+        return zlib.decompress(row[0]), row[1], row[2]
+
+    def put(self, b_type, commit, data, etag=None, last_modified=None):
+        """
+        Store the content of a result file.
+        """
+        compressed = zlib.compress(data)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results "
+                "(type, commit_hash, etag, last_modified, size, accessed, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    b_type,
+                    commit,
+                    etag,
+                    last_modified,
+                    len(compressed),
+                    time.time(),
+                    compressed,
+                ),
+            )
+            self._db.commit()
+
+    def discard(self, b_type, commit):
+        """
+        Remove a result from the cache.
+        """
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM results WHERE type = ? AND commit_hash = ?",
+                (b_type, commit),
+            )
+            self._db.commit()
+
+    def evict(self):
+        """
+        Remove the least recently used results until the content fits in
+        max_size bytes. Return the number of evicted results.
+        """
+        evicted = 0
+        with self._lock:
+            total = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()[0]
+            if total <= self.max_size:
+                return 0
+            rows = self._db.execute(
+                "SELECT type, commit_hash, size FROM results ORDER BY accessed"
+            ).fetchall()
+            for b_type, commit, size in rows:
+                if total <= self.max_size:
+                    break
+                self._db.execute(
+                    "DELETE FROM results WHERE type = ? AND commit_hash = ?",
+                    (b_type, commit),
+                )
+                total -= size
+                evicted += 1
+            self._db.commit()
+        return evicted
+
+    def close(self):
+        """
+        Evict results over the size limit and persist the cache.
+        """
+        evicted = self.evict()
+        if evicted:
+            print("Evicted {} results from the cache".format(evicted))
+        with self._lock:
+            self._db.commit()
+            if evicted:
+                self._db.execute("VACUUM")
+            self._db.close()
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+# SPDX-FileCopyrightText: 2026 EfficiOS Inc.
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Compact result format holding the results of all the benchmark types of a
+commit in a single file.
+
+Layout, all integers little endian:
+
+    magic         4 bytes, "BTBR"
+    version       uint16, FORMAT_VERSION
+    reserved      uint16, 0
+    header size   uint32
+    header        JSON, utf-8, padded with spaces to a multiple of 8 bytes
+    data          packed float64 columns
+
+The header is of the form:
+
+    {
+      "types": {
+        benchmark_type: {
+          "columns": {metric: [offset, count]},
+          "attributes": {key: value}
+        }
+      }
+    }
+
+Each column is a metric with one value per iteration (see time.py), None
+values are stored as NaN. The column offsets are relative to the start of
+the data section, which is 8 bytes aligned so that the columns can be read
+in place from a memory mapping. The values which are not flat lists of
+numbers (time series, iteration control, ...) are kept as JSON attributes.
+
+Writing only needs the standard library, it runs on the benchmark boards.
+Reading needs numpy.
+"""
+
+import argparse
+import array
+import json
+import mmap
+import struct
+import sys
+
+MAGIC = b"BTBR"
+FORMAT_VERSION = 1
+
+_PREAMBLE = struct.Struct("<4sHHI")
+
+
+class ResultFormatError(Exception):
+    """
+    Raised when a buffer is not a result file of a supported version.
+    """
+
+
+def is_column(value):
+    """
+    Return whether a result value is stored as a column.
+    """
+    return isinstance(value, list) and all(
+        v is None or (isinstance(v, (int, float)) and not isinstance(v, bool))
+        for v in value
+    )
+
+
+def dumps(results):
+    """
+    Return the compact representation of results, a dictionary of the form
+    {benchmark_type: result}, each result being the content of a time.py
+    result file.
+    """
+    header = {"types": {}}
+    data = array.array("d")
+    for b_type, result in results.items():
+        columns = {}
+        attributes = {}
+        for key, value in result.items():
+            if not is_column(value):
+                attributes[key] = value
+                continue
+            columns[key] = [len(data) * data.itemsize, len(value)]
+            data.extend(float("nan") if v is None else float(v) for v in value)
+        header["types"][b_type] = {"columns": columns, "attributes": attributes}
+
+    if sys.byteorder != "little":
+        data.byteswap()
+
+    header_data = json.dumps(header, separators=(",", ":")).encode()
+    # Align the data section on 8 bytes.
+    header_data += b" " * (-(_PREAMBLE.size + len(header_data)) % 8)
+    return (
+        _PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(header_data))
+        + header_data
+        + data.tobytes()
+    )
+
+
+def loads(buffer):
+    """
+    Read results from a buffer (bytes, memoryview, mmap, ...). Return a
+    dictionary of the form {benchmark_type: {key: value}} where the columns
+    are read-only numpy arrays referencing the buffer, without copy.
+    """
+    import numpy
+
+    if len(buffer) < _PREAMBLE.size:
+        raise ResultFormatError("Truncated result file")
+    magic, version, _, header_size = _PREAMBLE.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ResultFormatError("Not a result file")
+    if version != FORMAT_VERSION:
+        raise ResultFormatError("Unsupported result format version {}".format(version))
+
+    data_offset = _PREAMBLE.size + header_size
+    try:
+        header = json.loads(bytes(buffer[_PREAMBLE.size : data_offset]))
+    except ValueError as error:
+        raise ResultFormatError("Invalid header: {}".format(error)) from error
+
+    results = {}
+    for b_type, content in header["types"].items():
+        result = dict(content["attributes"])
+        for key, (offset, count) in content["columns"].items():
+            if data_offset + offset + count * 8 > len(buffer):
+                raise ResultFormatError("Truncated result file")
+            result[key] = numpy.frombuffer(
+                buffer, dtype="<f8", count=count, offset=data_offset + offset
+            )
+        results[b_type] = result
+    return results
+
+
+def load(path):
+    """
+    Read results from a file through a memory mapping, see loads().
+    """
+    with open(path, "rb") as result_file:
+        return loads(mmap.mmap(result_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def pack(output, inputs):
+    """
+    Pack time.py result files, a dictionary of the form {benchmark_type:
+    path}, into a single compact result file.
+    """
+    results = {}
+    for b_type, path in inputs.items():
+        with open(path) as result_file:
+            results[b_type] = json.load(result_file)
+    with open(output, "wb") as out:
+        out.write(dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact benchmark result files")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    pack_parser = subparsers.add_parser(
+        "pack", help="Pack the time.py results of the benchmark types of a commit"
+    )
+    pack_parser.add_argument("--output", required=True, help="The packed result file")
+    pack_parser.add_argument(
+        "inputs",
+        nargs="+",
+        metavar="TYPE=PATH",
+        help="A benchmark type and the path of its time.py result",
+    )
+    dump_parser = subparsers.add_parser("dump", help="Print a packed result as JSON")
+    dump_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.action == "pack":
+        inputs = {}
+        for value in args.inputs:
+            b_type, sep, path = value.partition("=")
+            if not sep:
+                parser.error("Invalid input {}, expected TYPE=PATH".format(value))
+            inputs[b_type] = path
+        pack(args.output, inputs)
+    else:
+        results = load(args.path)
+        json.dump(
+            {
+                b_type: {
+                    k: v.tolist() if hasattr(v, "tolist") else v
+                    for k, v in result.items()
+                }
+                for b_type, result in results.items()
+            },
+            sys.stdout,
+            sort_keys=True,
+            indent=4,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -16,9 +16,15 @@
 
 import argparse
 import json
+import math
 import os
+import resource
+import select
+import shlex
+import statistics
 import subprocess
 import tempfile
+import time
 from collections import defaultdict
 
 
@@ -83,6 +89,31 @@ _METRIC = {
 }
 
 
+# Time series keys of the native runner, one list of samples per iteration
+_SAMPLED_METRIC = [
+    "Sampled time (seconds)",
+    "Sampled resident set size (kbytes)",
+    "Sampled CPU usage (percent)",
+]
+
+
+# Hardware counters recorded with `perf stat` and their result keys
+_PERF_EVENTS = {
+    "cycles": "Cycles",
+    "instructions": "Instructions",
+    "cache-misses": "Cache misses",
+    "branch-misses": "Branch misses",
+}
+
+
+# Root of the cgroup v2 hierarchy and the cgroup isolating the benchmark
+_CGROUP_ROOT = "/sys/fs/cgroup"
+_CGROUP_NAME = "babeltrace-benchmark"
+
+# Maximum number of noisy iterations rejected and run again
+_MAX_REJECTED = 10
+
+
 def parse(path, results):
     """
     Parser and accumulator for /usr/bin/time results.
@@ -98,6 +129,55 @@ def parse(path, results):
     return results
 
 
+def perf_command(output):
+    """
+    Return the `perf stat` command line prefix recording the hardware counters
+    of a command to output.
+    """
+    return [
+        "perf",
+        "stat",
+        "--field-separator",
+        ",",
+        "--output",
+        output,
+        "--event",
+        ",".join(_PERF_EVENTS),
+        "--",
+    ]
+
+
+def parse_perf(path, results):
+    """
+    Parser and accumulator for `perf stat` CSV results. Counters which are
+    not supported or were not counted are recorded as None.
+    """
+    values = {}
+    with open(path, "r") as data:
+        for line in data:
+            fields = line.strip().split(",")
+            if line.startswith("#") or len(fields) < 3:
+                continue
+            # Strip the modifiers ("cycles:u") and, on hybrid systems, the PMU
+            # ("cpu_core/cycles/") of the event name.
+            event = fields[2].split(":")[0]
+            if "/" in event:
+                event = event.strip("/").split("/")[-1]
+            if event not in _PERF_EVENTS:
+                continue
+            try:
+                value = int(float(fields[0]))
+            except ValueError:
+                values.setdefault(event, None)
+                continue
+            # Hybrid systems report one line per PMU.
+            values[event] = (values.get(event) or 0) + value
+
+    for event, key in _PERF_EVENTS.items():
+        results[key].append(values.get(event))
+    return results
+
+
 def save(path, results):
     """
     Save the result in json format to path.
@@ -106,25 +186,541 @@ def save(path, results):
         json.dump(results, out, sort_keys=True, indent=4)
 
 
-def run(command, iteration, output, stdout, stderr, taskset=""):
+def format_cpu_list(cpus):
     """
-    Run the command throught /usr/bin/time n iterations and parse each result.
+    Format a set of CPUs as a CPU list (e.g. "0,2-3").
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(
+        str(first) if first == last else "{}-{}".format(first, last)
+        for first, last in ranges
+    )
+
+
+def read_file(path):
+    """
+    Return the stripped content of a file, None if it can't be read.
+    """
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def write_file(path, value):
+    """
+    Write a value to a sysfs/procfs/cgroupfs file. Return whether it worked.
+    """
+    try:
+        with open(path, "w") as f:
+            f.write(value)
+        return True
+    except OSError:
+        return False
+
+
+class NoiseHarness:
+    """
+    Control and measure the system noise on the CPUs running the benchmark.
+
+    setup() optionally isolates the CPUs in an exclusive cgroup v2 cpuset
+    partition, which removes them from the other tasks, and moves the IRQs to
+    the other CPUs. teardown() undoes it. Only the benchmark processes enter
+    the cgroup, see enter_cgroup(), time.py itself stays in its own cgroup.
+
+    Each iteration is measured: interrupts, context switches and the CPU time
+    not used by the benchmark on its CPUs. An iteration where the other CPU
+    time exceeds max_noise times its elapsed time is rejected.
+    """
+
+    def __init__(self, cpus, isolate=False, move_irqs=False, max_noise=0):
+        self.cpus = set(cpus)
+        self.isolate = isolate
+        self.move_irqs = move_irqs
+        self.max_noise = max_noise
+        self.cgroup = None
+        self.original_cgroup = None
+        self.irq_affinities = {}
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+
+    def housekeeping_cpus(self):
+        """
+        Return the CPUs left to the rest of the system.
+        """
+        return set(os.sched_getaffinity(0)) - self.cpus
+
+    def cpu_state(self):
+        """
+        Return the frequency governor of each benchmark CPU and whether turbo
+        (or boost) is enabled, None if unknown.
+        """
+        governors = {
+            str(cpu): read_file(
+                "/sys/devices/system/cpu/cpu{}/cpufreq/scaling_governor".format(cpu)
+            )
+            for cpu in sorted(self.cpus)
+        }
+        turbo = None
+        no_turbo = read_file("/sys/devices/system/cpu/intel_pstate/no_turbo")
+        boost = read_file("/sys/devices/system/cpu/cpufreq/boost")
+        if no_turbo is not None:
+            turbo = no_turbo == "0"
+        elif boost is not None:
+            turbo = boost == "1"
+        return governors, turbo
+
+    def setup(self, results):
+        governors, turbo = self.cpu_state()
+        for cpu, governor in governors.items():
+            if governor not in (None, "performance"):
+                print("Warning: CPU {} uses the {} governor".format(cpu, governor))
+        if turbo:
+            print("Warning: turbo is enabled")
+        results["CPU frequency governors"] = governors
+        results["Turbo enabled"] = turbo
+
+        self.original_cgroup = self.current_cgroup()
+        if self.isolate:
+            self.isolate_cpus()
+        if self.move_irqs:
+            self.move_irqs_away()
+        results["Isolated CPUs"] = self.cgroup is not None
+        results["Moved IRQs"] = len(self.irq_affinities)
+
+    @staticmethod
+    def current_cgroup():
+        """
+        Return the path of the cgroup v2 of the process, None if unknown.
+        """
+        for line in (read_file("/proc/self/cgroup") or "").splitlines():
+            if line.startswith("0::"):
+                return os.path.join(_CGROUP_ROOT, line[3:].lstrip("/"))
+        return None
+
+    def enter_cgroup(self):
+        """
+        Move the calling process to the isolated cgroup. Meant to run in the
+        benchmark child process before it executes the command.
+        """
+        if self.cgroup and not write_file(
+            os.path.join(self.cgroup, "cgroup.procs"), "0"
+        ):
+            os.write(2, b"Warning: could not move the benchmark to its cgroup\n")
+
+    def isolate_cpus(self):
+        if not os.path.exists(os.path.join(_CGROUP_ROOT, "cgroup.controllers")):
+            print("Warning: not isolating the CPUs, cgroup v2 is not mounted")
+            return
+        write_file(os.path.join(_CGROUP_ROOT, "cgroup.subtree_control"), "+cpuset")
+        cgroup = os.path.join(_CGROUP_ROOT, _CGROUP_NAME)
+        try:
+            os.makedirs(cgroup, exist_ok=True)
+        except OSError as error:
+            print("Warning: not isolating the CPUs:", error)
+            return
+        self.cgroup = cgroup
+        cpu_list = format_cpu_list(self.cpus)
+        write_file(os.path.join(cgroup, "cpuset.cpus"), cpu_list)
+        write_file(os.path.join(cgroup, "cpuset.cpus.exclusive"), cpu_list)
+        # "isolated" also disables the load balancing, it needs Linux 6.1.
+        partition = os.path.join(cgroup, "cpuset.cpus.partition")
+        if not write_file(partition, "isolated") and not write_file(partition, "root"):
+            print("Warning: the CPUs are not exclusive to the benchmark")
+
+    def move_irqs_away(self):
+        if not self.housekeeping_cpus():
+            print("Warning: not moving the IRQs, no CPU is left for them")
+            return
+        housekeeping = format_cpu_list(self.housekeeping_cpus())
+        for irq in os.listdir("/proc/irq"):
+            path = os.path.join("/proc/irq", irq, "smp_affinity_list")
+            affinity = read_file(path)
+            # Some interrupts can't be moved, leave them be.
+            if affinity is not None and write_file(path, housekeeping):
+                self.irq_affinities[path] = affinity
+
+    def teardown(self):
+        for path, affinity in self.irq_affinities.items():
+            write_file(path, affinity)
+        self.irq_affinities = {}
+        if self.cgroup:
+            # Move the leftover benchmark processes back to the cgroup
+            # time.py started in, the cgroup can't be removed otherwise.
+            procs = read_file(os.path.join(self.cgroup, "cgroup.procs")) or ""
+            destination = self.original_cgroup or _CGROUP_ROOT
+            for pid in procs.split():
+                write_file(os.path.join(destination, "cgroup.procs"), pid)
+            try:
+                os.rmdir(self.cgroup)
+            except OSError as error:
+                print("Warning: could not remove {}: {}".format(self.cgroup, error))
+            self.cgroup = None
+
+    def snapshot(self):
+        """
+        Return the interrupts, context switches (None if schedstat is not
+        available) and busy CPU time of the benchmark CPUs.
+        """
+        cpu_names = {"cpu{}".format(cpu) for cpu in self.cpus}
+        busy_ticks = 0
+        with open("/proc/stat") as stat:
+            for line in stat:
+                fields = line.split()
+                if fields[0] in cpu_names:
+                    # user nice system idle iowait irq softirq steal ...
+                    values = [int(v) for v in fields[1:9]]
+                    busy_ticks += sum(values) - values[3] - values[4]
+
+        interrupts = 0
+        with open("/proc/interrupts") as stat:
+            columns = stat.readline().split()
+            indexes = [i for i, name in enumerate(columns) if name.lower() in cpu_names]
+            for line in stat:
+                fields = line.split()[1:]
+                for i in indexes:
+                    if i < len(fields) and fields[i].isdigit():
+                        interrupts += int(fields[i])
+
+        switches = None
+        schedstat = read_file("/proc/schedstat")
+        if schedstat is not None:
+            switches = 0
+            for line in schedstat.splitlines():
+                fields = line.split()
+                # cpuN yld_count legacy sched_count ...
+                if fields[0] in cpu_names:
+                    switches += int(fields[3])
+        return interrupts, switches, busy_ticks / self.clock_ticks
+
+    def measure(self, run_once, i, results):
+        """
+        Run an iteration and record its noise. Return False if the iteration
+        is rejected.
+        """
+        before = self.snapshot()
+        start = time.perf_counter()
+        run_once(i, results)
+        elapsed = time.perf_counter() - start
+        after = self.snapshot()
+
+        benchmark_time = (
+            results["User time (seconds)"][-1] + results["System time (seconds)"][-1]
+        )
+        other_time = max(0.0, after[2] - before[2] - benchmark_time)
+        results["Interrupts on the benchmark CPUs"].append(after[0] - before[0])
+        results["Context switches on the benchmark CPUs"].append(
+            None if after[1] is None else after[1] - before[1]
+        )
+        results["Other CPU time on the benchmark CPUs (seconds)"].append(other_time)
+        return not self.max_noise or other_time <= self.max_noise * elapsed
+
+
+def relative_ci(results):
+    """
+    Return the half-width of the 95% confidence interval (normal
+    approximation) of the mean User time + System time of the iterations,
+    relative to that mean.
+    """
+    samples = [
+        u + s
+        for u, s in zip(
+            results["User time (seconds)"], results["System time (seconds)"]
+        )
+    ]
+    if len(samples) < 2:
+        return math.inf
+    mean = statistics.mean(samples)
+    if mean == 0:
+        return math.inf
+    return 1.96 * statistics.stdev(samples) / math.sqrt(len(samples)) / mean
+
+
+def iterate(run_once, iteration, warmup=0, target_ci=0, max_iteration=0, harness=None):
+    """
+    Call run_once(index, results) to accumulate the results of each
+    iteration. The first warmup iterations are discarded.
+
+    Without target_ci, iteration iterations are run. Otherwise, at least
+    iteration iterations are run and the command is run again until the
+    relative confidence interval of the User time + System time (see
+    relative_ci()) is at most target_ci or max_iteration iterations were
+    run. The number of iterations and the reached confidence interval are
+    recorded in the results.
+
+    With a NoiseHarness, the noise of each iteration is recorded and the
+    iterations it rejects are run again, up to _MAX_REJECTED times.
     """
     results = defaultdict(list)
-    for i in range(iteration):
+    if harness is not None:
+        harness.setup(results)
+
+    try:
+        for i in range(warmup):
+            run_once("warmup {}".format(i), defaultdict(list))
+
+        i = 0
+        rejected = 0
+        while True:
+            if harness is None:
+                run_once(i, results)
+            else:
+                iteration_results = defaultdict(list)
+                accepted = harness.measure(run_once, i, iteration_results)
+                if not accepted and rejected < _MAX_REJECTED:
+                    print("Iteration: {}, rejected because of system noise".format(i))
+                    rejected += 1
+                    continue
+                for key, values in iteration_results.items():
+                    results[key].extend(values)
+            i += 1
+            if not target_ci:
+                if i >= iteration:
+                    break
+                continue
+            if i >= iteration and relative_ci(results) <= target_ci:
+                break
+            if max_iteration and i >= max_iteration:
+                break
+    finally:
+        if harness is not None:
+            harness.teardown()
+
+    results["Warmup iterations"] = warmup
+    results["Iterations"] = i
+    if harness is not None:
+        results["Rejected iterations"] = rejected
+    if target_ci:
+        ci = relative_ci(results)
+        results["Target relative confidence interval"] = target_ci
+        results["Relative confidence interval"] = ci if math.isfinite(ci) else None
+        results["Converged"] = ci <= target_ci
+    return results
+
+
+def run(
+    command,
+    iteration,
+    output,
+    stdout,
+    stderr,
+    taskset="",
+    perf_counters=False,
+    warmup=0,
+    target_ci=0,
+    max_iteration=0,
+    harness=None,
+):
+    """
+    Run the command throught /usr/bin/time n iterations and parse each result.
+    With perf_counters, /usr/bin/time is run under `perf stat` to record the
+    hardware counters of the command, perf itself is not part of the
+    /usr/bin/time results. See iterate() for the iteration control and the
+    noise harness.
+    """
+
+    def run_once(i, results):
         time_stdout = tempfile.NamedTemporaryFile(delete=False)
         # We must delete this file later on.
         time_stdout.close()
+        perf_output = None
         with open(stdout, "a+") as out, open(stderr, "a+") as err:
             cmd = "/usr/bin/time -v --output='{}' {}".format(time_stdout.name, command)
+            if perf_counters:
+                perf_output = "{}.perf".format(time_stdout.name)
+                cmd = "{} {}".format(shlex.join(perf_command(perf_output)), cmd)
             if taskset:
                 cmd = "taskset -c {} {}".format(taskset, cmd)
-            ret = subprocess.run(cmd, shell=True, stdout=out, stderr=err)
+            ret = subprocess.run(
+                cmd,
+                shell=True,
+                stdout=out,
+                stderr=err,
+                preexec_fn=harness.enter_cgroup if harness else None,
+            )
             if ret.returncode != 0:
                 print("Iteration: {}, Command failed: {}".format(str(i), cmd))
                 subprocess.run(["cat", stderr])
-        results = parse(time_stdout.name, results)
+        parse(time_stdout.name, results)
         os.remove(time_stdout.name)
+        if perf_output:
+            parse_perf(perf_output, results)
+            os.remove(perf_output)
+
+    save(
+        output,
+        iterate(run_once, iteration, warmup, target_ci, max_iteration, harness),
+    )
+
+
+def parse_cpu_list(value):
+    """
+    Parse a CPU list in the format of `taskset -c` (e.g. "0,2-3").
+    """
+    cpus = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def sample_process(pid):
+    """
+    Return the CPU time (user + system, in seconds) and resident set size (in
+    kbytes) of a running process from /proc, None if it is gone.
+    """
+    try:
+        with open("/proc/{}/stat".format(pid)) as stat:
+            # The command name can contain spaces, the fields follow the last ')'.
+            fields = stat.read().rsplit(")", 1)[1].split()
+        with open("/proc/{}/statm".format(pid)) as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # utime and stime are the 14th and 15th fields of /proc/<pid>/stat.
+    cpu_ticks = int(fields[11]) + int(fields[12])
+    return (
+        cpu_ticks / os.sysconf("SC_CLK_TCK"),
+        resident_pages * resource.getpagesize() // 1024,
+    )
+
+
+def run_native_iteration(args, out, err, cpus=None, sample_interval=0, preexec_fn=None):
+    """
+    Spawn the command, without a shell, and wait for it with os.wait4().
+    Return a (returncode, rusage, elapsed seconds, samples) tuple, samples
+    being a list of (time, RSS, CPU usage) tuples taken every
+    sample_interval seconds when it is set. preexec_fn, when set, is called
+    in the child process before the command is executed.
+    """
+
+    def setup_child():
+        if preexec_fn:
+            preexec_fn()
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+
+    samples = []
+    start = time.perf_counter_ns()
+    proc = subprocess.Popen(args, stdout=out, stderr=err, preexec_fn=setup_child)
+    if sample_interval > 0:
+        # The pidfd becomes readable as soon as the child exits, so the exit
+        # is not delayed to the next sample.
+        pidfd = os.pidfd_open(proc.pid)
+        try:
+            poller = select.poll()
+            poller.register(pidfd, select.POLLIN)
+            last_time, last_cpu = start, 0.0
+            while not poller.poll(sample_interval * 1000):
+                sample = sample_process(proc.pid)
+                now = time.perf_counter_ns()
+                if sample is not None:
+                    cpu, rss = sample
+                    usage = 100.0 * (cpu - last_cpu) * 1e9 / max(now - last_time, 1)
+                    samples.append(((now - start) / 1e9, rss, usage))
+                    last_time, last_cpu = now, cpu
+        finally:
+            os.close(pidfd)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = (time.perf_counter_ns() - start) / 1e9
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, rusage, elapsed, samples
+
+
+def rusage_results(rusage, elapsed, samples, results):
+    """
+    Accumulate the rusage of an iteration under the /usr/bin/time keys.
+    """
+    user = rusage.ru_utime
+    system = rusage.ru_stime
+    average_rss = 0
+    if samples:
+        average_rss = int(sum(s[1] for s in samples) / len(samples))
+
+    results["User time (seconds)"].append(user)
+    results["System time (seconds)"].append(system)
+    results["Percent of CPU this job got"].append(
+        100.0 * (user + system) / elapsed if elapsed else 0
+    )
+    results["Elapsed (wall clock) time (h:mm:ss or m:ss)"].append(elapsed)
+    results["Average shared text size (kbytes)"].append(rusage.ru_ixrss)
+    results["Average unshared data size (kbytes)"].append(rusage.ru_idrss)
+    results["Average stack size (kbytes)"].append(rusage.ru_isrss)
+    results["Average total size (kbytes)"].append(
+        rusage.ru_ixrss + rusage.ru_idrss + rusage.ru_isrss
+    )
+    results["Maximum resident set size (kbytes)"].append(rusage.ru_maxrss)
+    results["Average resident set size (kbytes)"].append(average_rss)
+    results["Major (requiring I/O) page faults"].append(rusage.ru_majflt)
+    results["Minor (reclaiming a frame) page faults"].append(rusage.ru_minflt)
+    results["Voluntary context switches"].append(rusage.ru_nvcsw)
+    results["Involuntary context switches"].append(rusage.ru_nivcsw)
+    results["Swaps"].append(rusage.ru_nswap)
+    results["File system inputs"].append(rusage.ru_inblock)
+    results["File system outputs"].append(rusage.ru_oublock)
+    results["Socket messages sent"].append(rusage.ru_msgsnd)
+    results["Socket messages received"].append(rusage.ru_msgrcv)
+    results["Signals delivered"].append(rusage.ru_nsignals)
+    results["Page size (bytes)"].append(resource.getpagesize())
+
+    if samples:
+        for key, values in zip(_SAMPLED_METRIC, zip(*samples)):
+            results[key].append(list(values))
+    return results
+
+
+def run_native(
+    command,
+    iteration,
+    output,
+    stdout,
+    stderr,
+    taskset="",
+    sample_interval=0,
+    warmup=0,
+    target_ci=0,
+    max_iteration=0,
+    harness=None,
+):
+    """
+    Run the command n iterations without /usr/bin/time nor a shell. The
+    resource usage of each iteration comes from os.wait4() and its wall time
+    from time.perf_counter_ns(). When sample_interval is set, the RSS and CPU
+    usage of the process are also sampled from /proc every sample_interval
+    seconds. See iterate() for the iteration control and the noise harness.
+    """
+    args = shlex.split(command)
+    cpus = parse_cpu_list(taskset) if taskset else None
+
+    def run_once(i, results):
+        with open(stdout, "a+") as out, open(stderr, "a+") as err:
+            returncode, rusage, elapsed, samples = run_native_iteration(
+                args,
+                out,
+                err,
+                cpus,
+                sample_interval,
+                harness.enter_cgroup if harness else None,
+            )
+        if returncode != 0:
+            print("Iteration: {}, Command failed: {}".format(str(i), command))
+            subprocess.run(["cat", stderr])
+        rusage_results(rusage, elapsed, samples, results)
+
+    results = iterate(run_once, iteration, warmup, target_ci, max_iteration, harness)
+    if sample_interval > 0:
+        results["Sampling interval (seconds)"] = sample_interval
     save(output, results)
 
 
@@ -157,6 +753,42 @@ def main():
         "Page size (bytes)": [],
       }
     }
+
+    With --native, the command is spawned directly and the same keys are
+    filled from its rusage. The wall clock time is then in seconds with a
+    sub-millisecond resolution. With --sample-interval, the following time
+    series (one list per iteration) are added:
+        "Sampling interval (seconds)": interval,
+        "Sampled time (seconds)": [[]],
+        "Sampled resident set size (kbytes)": [[]],
+        "Sampled CPU usage (percent)": [[]],
+
+    Without --native, --perf-counters adds the hardware counters of each
+    iteration, None when a counter is not available:
+        "Cycles": [],
+        "Instructions": [],
+        "Cache misses": [],
+        "Branch misses": [],
+
+    The iteration control is recorded with:
+        "Warmup iterations": warmup,
+        "Iterations": iterations,
+    and, with --target-ci:
+        "Target relative confidence interval": target,
+        "Relative confidence interval": reached,
+        "Converged": bool,
+
+    With --noise-harness (implied by --isolate-cpus, --move-irqs and
+    --max-noise), the state of the CPUs and the noise of each iteration are
+    added:
+        "CPU frequency governors": {cpu: governor},
+        "Turbo enabled": bool,
+        "Isolated CPUs": bool,
+        "Moved IRQs": count,
+        "Rejected iterations": count,
+        "Interrupts on the benchmark CPUs": [],
+        "Context switches on the benchmark CPUs": [],
+        "Other CPU time on the benchmark CPUs (seconds)": [],
     """
     parser = argparse.ArgumentParser(
         description="Run command N time using /usr/bin/time and collect the statistics"
@@ -167,7 +799,25 @@ def main():
         "--iteration",
         type=int,
         default=5,
-        help="The number of iteration to run the command (default: 5)",
+        help="The number of iteration to run the command, the minimum with --target-ci (default: 5)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=0,
+        help="The number of iterations run and discarded before the measured ones (default: 0)",
+    )
+    parser.add_argument(
+        "--target-ci",
+        type=float,
+        default=0,
+        help="Iterate until the half-width of the 95%% confidence interval of the user + system time is at most this fraction of its mean, e.g. 0.01 (default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--max-iteration",
+        type=int,
+        default=50,
+        help="The maximum number of iterations with --target-ci (default: 50)",
     )
     parser.add_argument(
         "--stdout",
@@ -184,8 +834,82 @@ def main():
         default="",
         help="Define a CPU taskset for the test command. See `man taskset`'s `-c` argument",
     )
+    parser.add_argument(
+        "--native",
+        action="store_true",
+        help="Spawn the command directly and collect its resource usage with wait4() instead of using /usr/bin/time and a shell",
+    )
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=0,
+        help="With --native, sample the RSS and CPU usage of the command every N seconds (default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--perf-counters",
+        action="store_true",
+        help="Run each iteration under `perf stat` to record the cycles, instructions, cache misses and branch misses, not available with --native",
+    )
+
+    parser.add_argument(
+        "--noise-harness",
+        action="store_true",
+        help="Record the CPU governors and turbo state and the noise (interrupts, context switches, CPU time of other tasks) on the --taskset CPUs during each iteration",
+    )
+    parser.add_argument(
+        "--isolate-cpus",
+        action="store_true",
+        help="Make the --taskset CPUs exclusive to the benchmark with a cgroup v2 cpuset partition, needs root",
+    )
+    parser.add_argument(
+        "--move-irqs",
+        action="store_true",
+        help="Move the IRQs away from the --taskset CPUs during the benchmark, needs root",
+    )
+    parser.add_argument(
+        "--max-noise",
+        type=float,
+        default=0,
+        help="Reject and run again the iterations where other tasks used more than this fraction of the elapsed time on the --taskset CPUs, e.g. 0.01 (default: 0, disabled)",
+    )
 
     args = parser.parse_args()
+    harness = None
+    if args.noise_harness or args.isolate_cpus or args.move_irqs or args.max_noise:
+        if not args.taskset:
+            parser.error("the noise harness requires --taskset")
+        harness = NoiseHarness(
+            parse_cpu_list(args.taskset),
+            args.isolate_cpus,
+            args.move_irqs,
+            args.max_noise,
+        )
+
+    if args.sample_interval and not args.native:
+        parser.error("--sample-interval requires --native")
+    if args.perf_counters and args.native:
+        # The rusage of perf, which wait4() would return, includes its own
+        # CPU time and memory.
+        parser.error("--perf-counters can't be used with --native")
+    if args.target_ci and args.max_iteration < args.iteration:
+        parser.error("--max-iteration must be at least --iteration")
+
+    if args.native:
+        run_native(
+            args.command,
+            args.iteration,
+            args.output,
+            args.stdout,
+            args.stderr,
+            args.taskset,
+            args.sample_interval,
+            args.warmup,
+            args.target_ci,
+            args.max_iteration,
+            harness,
+        )
+        return
+
     run(
         args.command,
         args.iteration,
@@ -193,6 +917,11 @@ def main():
         args.stdout,
         args.stderr,
         args.taskset,
+        args.perf_counters,
+        args.warmup,
+        args.target_ci,
+        args.max_iteration,
+        harness,
     )
 
 
@@ -0,0 +1,354 @@
+#!/usr/bin/python3
+# SPDX-FileCopyrightText: 2026 EfficiOS Inc.
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Shared helpers to track LAVA jobs.
+
+The XML-RPC server proxy keeps its HTTP connection open between calls, all
+the calls of a JobWatcher go through a single proxy and are serialized so
+that many jobs can be tracked over one connection.
+"""
+
+import asyncio
+import http.client
+import json
+import xmlrpc.client
+
+# States of a job which did not end yet
+ACTIVE_JOB_STATES = ["Submitted", "Scheduling", "Scheduled", "Running"]
+
+# States in which the job is waiting for a device
+QUEUED_JOB_STATES = ["Submitted", "Scheduling", "Scheduled"]
+
+# Polling intervals, in seconds
+DEFAULT_QUEUED_INTERVAL = 30
+DEFAULT_MIN_INTERVAL = 10
+DEFAULT_MAX_INTERVAL = 120
+DEFAULT_MAX_ERROR_DELAY = 300
+DEFAULT_LOG_INTERVAL = 15
+DEFAULT_RESULTS_INTERVAL = 30
+
+# Number of log lines fetched per request
+DEFAULT_LOG_CHUNK_LINES = 5000
+
+# Number of test case results fetched per request
+DEFAULT_RESULTS_CHUNK = 500
+
+# Number of attempts of a call before giving up on errors
+DEFAULT_MAX_ATTEMPTS = 20
+
+# Errors after which the call is retried
+RETRY_ERRORS = (xmlrpc.client.ProtocolError, http.client.HTTPException, OSError)
+
+
+def yaml_loader():
+    """
+    Return the fastest available safe YAML loader.
+    """
+    import yaml
+
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def parse_log(text):
+    """
+    Parse the lines of a LAVA job log, yield the log entries (dictionaries
+    with the "dt", "lvl" and "msg" keys).
+
+    Each line is a YAML list item holding a flow mapping, which is almost
+    always valid JSON. Lines are parsed as JSON first and only fall back to
+    the (C, if available) YAML loader otherwise.
+    """
+    loader = None
+    for line in text.splitlines():
+        if not line.startswith("- "):
+            continue
+        try:
+            yield json.loads(line[2:])
+            continue
+        except ValueError:
+            pass
+        if loader is None:
+            import yaml
+
+            loader = yaml_loader()
+        entry = yaml.load(line[2:], Loader=loader)
+        if isinstance(entry, dict):
+            yield entry
+
+
+def get_server(proto, username, token, host):
+    """
+    Return a LAVA XML-RPC server proxy.
+    """
+    return xmlrpc.client.ServerProxy(
+        "%s://%s:%s@%s/RPC2" % (proto, username, token, host)
+    )
+
+
+class JobWatcher:
+    """
+    Watch the state of LAVA jobs with adaptive polling.
+
+    While a job waits for a device it is polled every queued_interval
+    seconds. Once running, the interval starts at min_interval and grows by
+    half at each poll up to max_interval, long runs are polled less often.
+    The interval is reset whenever the state changes. Errors are retried
+    with an exponential backoff capped at max_error_delay seconds, up to
+    max_attempts attempts after which the error is raised.
+    """
+
+    def __init__(
+        self,
+        server,
+        queued_interval=DEFAULT_QUEUED_INTERVAL,
+        min_interval=DEFAULT_MIN_INTERVAL,
+        max_interval=DEFAULT_MAX_INTERVAL,
+        max_error_delay=DEFAULT_MAX_ERROR_DELAY,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        verbose=True,
+    ):
+        self.server = server
+        self.queued_interval = queued_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_error_delay = max_error_delay
+        self.max_attempts = max_attempts
+        self.verbose = verbose
+        self._lock = None
+
+    def _print(self, message):
+        if self.verbose:
+            print(message, flush=True)
+
+    async def call(self, function, *args):
+        """
+        Run function(*args), typically an XML-RPC call on the server, in a
+        thread. Calls are serialized since the server proxy and its
+        connection are shared.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            return await asyncio.to_thread(function, *args)
+
+    async def call_retry(self, description, function, *args):
+        """
+        Like call(), retrying on errors with an exponential backoff. The error
+        is raised after max_attempts failed attempts.
+        """
+        delay = 1
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await self.call(function, *args)
+            except RETRY_ERRORS as error:
+                if attempt == self.max_attempts:
+                    self._print(
+                        "Error while {}, giving up after {} attempts: {}".format(
+                            description, attempt, error
+                        )
+                    )
+                    raise
+                self._print(
+                    "Error while {}, retrying in {}s: {}".format(
+                        description, delay, error
+                    )
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_error_delay)
+
+    async def job_state(self, jobid):
+        """
+        Return the state of a job, retrying on errors, see call_retry().
+        """
+        state = await self.call_retry(
+            "getting the state of job {}".format(jobid),
+            self.server.scheduler.job_state,
+            jobid,
+        )
+        return state["job_state"]
+
+    async def follow_logs(
+        self,
+        jobid,
+        on_entry,
+        interval=DEFAULT_LOG_INTERVAL,
+        chunk_lines=DEFAULT_LOG_CHUNK_LINES,
+    ):
+        """
+        Fetch the log of a job incrementally, by chunks of chunk_lines lines,
+        until the job is finished and calls on_entry with each log entry as
+        it is received. New lines are polled every interval seconds.
+        """
+        offset = 0
+        while True:
+            finished, data = await self.call_retry(
+                "getting the log of job {}".format(jobid),
+                self.server.scheduler.jobs.logs,
+                str(jobid),
+                offset,
+                offset + chunk_lines,
+            )
+            text = data.data.decode("utf-8", errors="replace")
+            # Only consume complete lines, a partial one is fetched again.
+            text = text[: text.rfind("\n") + 1]
+            for entry in parse_log(text):
+                on_entry(entry)
+            lines = text.count("\n")
+            offset += lines
+            if lines >= chunk_lines:
+                continue
+            if finished:
+                return
+            await asyncio.sleep(interval)
+
+    async def follow_results(
+        self,
+        jobid,
+        on_result,
+        done,
+        interval=DEFAULT_RESULTS_INTERVAL,
+        chunk=DEFAULT_RESULTS_CHUNK,
+    ):
+        """
+        Fetch the test case results of a job incrementally while it runs and
+        call on_result with each new result. The results of each test suite
+        are fetched from the offset reached by the previous poll. Polling
+        stops once the done event is set, after a last poll.
+
+        When on_result returns a true value the job is canceled, if it did
+        not end yet. The results are still followed until the end of the job.
+        """
+        import yaml
+
+        loader = yaml_loader()
+        offsets = {}
+        canceled = False
+        while True:
+            last_poll = done.is_set()
+            suites = await self.call_retry(
+                "getting the test suites of job {}".format(jobid),
+                self.server.results.get_testjob_suites_list_yaml,
+                str(jobid),
+            )
+            for suite in yaml.load(suites, Loader=loader) or []:
+                name = suite["name"]
+                while True:
+                    content = await self.call_retry(
+                        "getting the results of job {}".format(jobid),
+                        self.server.results.get_testsuite_results_yaml,
+                        str(jobid),
+                        name,
+                        chunk,
+                        offsets.get(name, 0),
+                    )
+                    results = yaml.load(content, Loader=loader) or []
+                    offsets[name] = offsets.get(name, 0) + len(results)
+                    for result in results:
+                        cancel = on_result(result)
+                        if cancel and not canceled and not last_poll:
+                            self._print("Canceling job {}".format(jobid))
+                            await self.call_retry(
+                                "canceling job {}".format(jobid),
+                                self.server.scheduler.jobs.cancel,
+                                str(jobid),
+                            )
+                            canceled = True
+                    if len(results) < chunk:
+                        break
+            if last_poll:
+                return
+            try:
+                await asyncio.wait_for(done.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def watch(self, jobid, on_change=None):
+        """
+        Wait for the end of a job and return its final state. on_change, when
+        set, is called with the job id and the new state each time the state
+        of the job changes.
+        """
+        state = None
+        interval = self.min_interval
+        while True:
+            new_state = await self.job_state(jobid)
+            if new_state != state:
+                state = new_state
+                interval = self.min_interval
+                if on_change:
+                    on_change(jobid, state)
+                if state == "Running":
+                    self._print("Job {} started running".format(jobid))
+            elif state == "Running":
+                interval = min(interval * 1.5, self.max_interval)
+
+            if state not in ACTIVE_JOB_STATES:
+                self._print("Job {} ended with {} status.".format(jobid, state))
+                return state
+
+            if state in QUEUED_JOB_STATES:
+                await asyncio.sleep(self.queued_interval)
+            else:
+                await asyncio.sleep(interval)
+
+    async def watch_all(self, jobids, on_change=None):
+        """
+        Wait for the end of all the jobs. Return a dictionary of their final
+        states.
+        """
+        states = await asyncio.gather(*[self.watch(j, on_change) for j in jobids])
+        return dict(zip(jobids, states))
+
+
+def wait_for_jobs(server, jobids, **kwargs):
+    """
+    Wait for the end of the jobs. Return a dictionary of their final states.
+    The keyword arguments are passed to JobWatcher.
+    """
+    watcher = JobWatcher(server, **kwargs)
+    return asyncio.run(watcher.watch_all(list(jobids)))
+
+
+def wait_for_job(server, jobid, on_log_entry=None, on_result=None, **kwargs):
+    """
+    Wait for the end of a job and return its final state.
+
+    When on_log_entry is set, the log of the job is followed while it runs
+    and each log entry is passed to it. When on_result is set, the test case
+    results are followed while the job runs and each of them is passed to
+    it, see JobWatcher.follow_results().
+    """
+    if on_log_entry is None and on_result is None:
+        return wait_for_jobs(server, [jobid], **kwargs)[jobid]
+
+    watcher = JobWatcher(server, **kwargs)
+
+    async def watch_and_follow():
+        done = asyncio.Event()
+
+        async def watch():
+            try:
+                return await watcher.watch(jobid)
+            finally:
+                done.set()
+
+        tasks = [watch()]
+        if on_log_entry is not None:
+            tasks.append(watcher.follow_logs(jobid, on_log_entry))
+        if on_result is not None:
+            tasks.append(watcher.follow_results(jobid, on_result, done))
+        state, *_ = await asyncio.gather(*tasks)
+        return state
+
+    return asyncio.run(watch_and_follow())
+
+
+def read_logs(server, jobid, on_entry, chunk_lines=DEFAULT_LOG_CHUNK_LINES):
+    """
+    Read the whole log of a finished job by chunks, passing each log entry
+    to on_entry.
+    """
+    watcher = JobWatcher(server)
+    asyncio.run(watcher.follow_logs(jobid, on_entry, 0, chunk_lines))
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+# SPDX-FileCopyrightText: 2026 EfficiOS Inc.
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Shared rendering of the LAVA job definitions.
+
+The jinja2 environment of each template directory is created once per
+process and its compiled templates are kept in an on-disk bytecode cache,
+the templates are only parsed again when they change. Rendered definitions
+are checked against the structure LAVA expects before being submitted.
+"""
+
+import os
+
+import lava_client
+import yaml
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+DEFAULT_BYTECODE_CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "lttng-ci",
+    "jinja2",
+)
+
+# Top level keys of a job definition and their expected type
+JOB_SCHEMA = {
+    "device_type": str,
+    "job_name": str,
+    "timeouts": dict,
+    "priority": (str, int),
+    "visibility": (str, dict),
+    "actions": list,
+}
+
+OPTIONAL_JOB_SCHEMA = {
+    "secrets": dict,
+    "context": dict,
+    "tags": list,
+    "environment": dict,
+    "metadata": dict,
+}
+
+ACTION_TYPES = ["deploy", "boot", "test", "command"]
+
+_environments = {}
+
+
+class JobDefinitionError(Exception):
+    """
+    Raised when a rendered job definition is not a valid LAVA job.
+    """
+
+
+def get_environment(template_dir, bytecode_cache_dir=DEFAULT_BYTECODE_CACHE_DIR):
+    """
+    Return the jinja2 environment of a template directory, created on first
+    use. The bytecode cache is not used if its directory can't be created.
+    """
+    template_dir = os.path.realpath(template_dir)
+    env = _environments.get(template_dir)
+    if env is not None:
+        return env
+
+    bytecode_cache = None
+    if bytecode_cache_dir:
+        try:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        except OSError as error:
+            print("Not using the template bytecode cache:", error)
+
+    env = Environment(
+        loader=FileSystemLoader(template_dir),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        bytecode_cache=bytecode_cache,
+    )
+    _environments[template_dir] = env
+    return env
+
+
+def validate(job_definition):
+    """
+    Check that a rendered job definition is well-formed YAML with the
+    structure of a LAVA job. Raise JobDefinitionError otherwise.
+    """
+    try:
+        job = yaml.load(job_definition, Loader=lava_client.yaml_loader())
+    except yaml.YAMLError as error:
+        raise JobDefinitionError("Invalid YAML: {}".format(error)) from error
+
+    if not isinstance(job, dict):
+        raise JobDefinitionError("The job definition is not a mapping")
+
+    for schema, required in [(JOB_SCHEMA, True), (OPTIONAL_JOB_SCHEMA, False)]:
+        for key, expected_type in schema.items():
+            if key not in job:
+                if required:
+                    raise JobDefinitionError("Missing key '{}'".format(key))
+                continue
+            if not isinstance(job[key], expected_type):
+                raise JobDefinitionError(
+                    "Key '{}' has an unexpected type: {}".format(
+                        key, type(job[key]).__name__
+                    )
+                )
+
+    if "job" not in job["timeouts"]:
+        raise JobDefinitionError("Missing job timeout")
+
+    if not job["actions"]:
+        raise JobDefinitionError("The job has no actions")
+    for index, action in enumerate(job["actions"]):
+        if (
+            not isinstance(action, dict)
+            or len(action) != 1
+            or next(iter(action)) not in ACTION_TYPES
+        ):
+            raise JobDefinitionError(
+                "Action #{} is not one of {}".format(index, ", ".join(ACTION_TYPES))
+            )
+
+
+def render(template_dir, template_name, context, check=True):
+    """
+    Render a job definition from a template of template_dir. The result is
+    validated unless check is False.
+    """
+    return render_many(template_dir, template_name, [context], check)[0]
+
+
+def render_many(template_dir, template_name, contexts, check=True):
+    """
+    Render one job definition per context from the same template, which is
+    loaded once. Return the list of job definitions.
+    """
+    template = get_environment(template_dir).get_template(template_name)
+    job_definitions = []
+    for context in contexts:
+        job_definition = template.render(context)
+        if check:
+            validate(job_definition)
+        job_definitions.append(job_definition)
+    return job_definitions
@@ -1,12 +1,15 @@
 #!/usr/bin/python3
 
 import argparse
+import concurrent.futures
 import enum
+import functools
 import logging
-import pathlib
 import os
+import pathlib
 import re
 import shutil
+import struct
 import subprocess
 import sys
 import tempfile
@@ -18,7 +21,26 @@ class UploadMethod(enum.StrEnum):
     curl = "curl"
 
 
-BuildID_re = re.compile(r"BuildID\[(?P<hash>[a-z0-9]+)\]=(?P<buildid>[a-z0-9]+)")
+ELF_MAGIC = b"\x7fELF"
+
+# Formats of the e_shoff, e_shentsize and e_shnum fields of the ELF header
+# and of a section header, by EI_CLASS
+ELF_CLASSES = {
+    1: ("32xI10xHH", "IIIIIIIIII"),
+    2: ("40xQ10xHH", "IIQQQQIIQQ"),
+}
+
+# ELF byte orders, by EI_DATA
+ELF_BYTE_ORDERS = {1: "<", 2: ">"}
+
+SHT_SYMTAB = 2
+SHT_NOTE = 7
+NT_GNU_BUILD_ID = 3
+
+# Names of the build-id hashes, by length, as reported by `file`
+BUILDID_HASHES = {8: "xxHash", 16: "md5/uuid", 20: "sha1"}
+
+LOG_FORMAT = "[%(asctime)s] - %(levelname)s - %(message)s"
 
 
 def get_argument_parser():
@@ -74,33 +96,116 @@ def get_argument_parser():
         help="Regexes to ignore file patterns",
         action="append",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=None,
+        type=int,
+        help="Number of processes scanning the files (default: the number of CPUs)",
+    )
     return parser
 
 
+def elf_buildid(path):
+    """
+    Read the GNU build-id note of an ELF file without running any program.
+    Return (buildid, stripped), buildid being None if the file has no
+    build-id, or None if the file is not an ELF file. The file is stripped
+    when it has no symbol table section.
+    """
+    with open(path, "rb") as f:
+        ident = f.read(16)
+        if len(ident) < 16 or ident[:4] != ELF_MAGIC:
+            return None
+        if ident[4] not in ELF_CLASSES or ident[5] not in ELF_BYTE_ORDERS:
+            return None
+        byte_order = ELF_BYTE_ORDERS[ident[5]]
+        header_format, section_format = ELF_CLASSES[ident[4]]
+        header = struct.Struct(byte_order + header_format)
+        section = struct.Struct(byte_order + section_format)
+
+        f.seek(0)
+        e_shoff, e_shentsize, e_shnum = header.unpack(f.read(header.size))
+        if e_shoff == 0 or e_shentsize < section.size:
+            return (None, True)
+
+        # Extended numbering, the number of sections is the size of the first
+        if e_shnum == 0:
+            f.seek(e_shoff)
+            e_shnum = section.unpack(f.read(section.size))[5]
+
+        f.seek(e_shoff)
+        table = f.read(e_shnum * e_shentsize)
+        sections = [
+            section.unpack_from(table, i * e_shentsize)
+            for i in range(len(table) // e_shentsize)
+        ]
+
+        stripped = not any(s[1] == SHT_SYMTAB for s in sections)
+        buildid = None
+        for _, sh_type, _, _, sh_offset, sh_size, _, _, sh_addralign, _ in sections:
+            if sh_type != SHT_NOTE:
+                continue
+            f.seek(sh_offset)
+            buildid = note_buildid(f.read(sh_size), byte_order, sh_addralign)
+            if buildid is not None:
+                break
+
+    return (buildid, stripped)
+
+
+def note_buildid(data, byte_order, alignment):
+    """
+    Return the hexadecimal GNU build-id found in the notes of a section,
+    None if there is none.
+    """
+    align = 8 if alignment == 8 else 4
+    note = struct.Struct(byte_order + "III")
+    offset = 0
+    while offset + note.size <= len(data):
+        namesz, descsz, n_type = note.unpack_from(data, offset)
+        name_offset = offset + note.size
+        desc_offset = name_offset + -(-namesz // align) * align
+        if desc_offset + descsz > len(data):
+            break
+        name = data[name_offset : name_offset + namesz]
+        if n_type == NT_GNU_BUILD_ID and name == b"GNU\0":
+            return data[desc_offset : desc_offset + descsz].hex()
+        offset = desc_offset + -(-descsz // align) * align
+    return None
+
+
 def files_buildid(path):
-    if not path.is_file():
+    # Like `file`, symbolic links are not followed
+    if path.is_symlink() or not path.is_file():
         return False
 
-    p = subprocess.Popen(["file", str(path)], stdout=subprocess.PIPE)
-    p.wait()
-    if p.returncode != 0:
-        logging.debug("Failed to run `file` on '{}': {}".format(path, p.returncode))
+    try:
+        elf = elf_buildid(path)
+    except (OSError, struct.error) as error:
+        logging.debug("Failed to read '{}': {}".format(path, error))
         return False
 
-    data = p.stdout.read().decode("utf-8")
-    m = BuildID_re.search(data)
-    if m:
-        logging.debug("{}: BuildID[{}]={}".format(path, m["hash"], m["buildid"]))
-        if "not stripped" in data:
-            return m["buildid"]
+    if elf is None:
+        return False
+
+    buildid, stripped = elf
+    if buildid:
+        logging.debug(
+            "{}: BuildID[{}]={}".format(
+                path, BUILDID_HASHES.get(len(buildid) // 2, "uuid"), buildid
+            )
+        )
+        if not stripped:
+            return buildid
 
         logging.debug("{}: is stripped, skipping".format(path))
 
     return False
 
 
-def files_with_buildid(path, ignore_files_res=[]):
-    _files = set()
+def files_with_buildid(path, ignore_files_res=[], jobs=None):
+    candidates = []
     for root, dirs, files in path.walk():
         for f in files:
             file_path = root / f
@@ -118,11 +223,28 @@ def files_with_buildid(path, ignore_files_res=[]):
             if skip:
                 continue
 
-            buildid = files_buildid(file_path)
-            if buildid:
-                _files.add((file_path, buildid))
+            candidates.append(file_path)
 
-    return _files
+    if jobs == 1:
+        buildids = list(map(files_buildid, candidates))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=functools.partial(
+                logging.basicConfig, level=logging.getLogger().level, format=LOG_FORMAT
+            ),
+        ) as executor:
+            buildids = list(
+                executor.map(
+                    files_buildid, candidates, chunksize=max(1, len(candidates) // 256)
+                )
+            )
+
+    return {
+        (file_path, buildid)
+        for file_path, buildid in zip(candidates, buildids)
+        if buildid
+    }
 
 
 def upload_debug_info(
@@ -160,9 +282,7 @@ def upload_debug_info(
 if __name__ == "__main__":
     parser = get_argument_parser()
     args = parser.parse_args()
-    logging.basicConfig(
-        level=args.loglevel, format="[%(asctime)s] - %(levelname)s - %(message)s"
-    )
+    logging.basicConfig(level=args.loglevel, format=LOG_FORMAT)
 
     if not args.files:
         args.files = [os.path.join(os.getenv("WORKSPACE", ""), "build")]
@@ -174,7 +294,7 @@ if __name__ == "__main__":
         ignore_res.append(re.compile(r))
 
     for f in args.files:
-        files = files.union(files_with_buildid(pathlib.Path(f), ignore_res))
+        files = files.union(files_with_buildid(pathlib.Path(f), ignore_res, args.jobs))
 
     logging.info("{} files with BuildIDs".format(len(files)))
     failures = 0
@@ -13,7 +13,12 @@ from urllib.parse import urljoin
 from urllib.request import urlretrieve
 
 import yaml
-from jinja2 import Environment, FileSystemLoader
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common")
+)
+import lava_client
+import lava_job
 
 LAVA_USERNAME = os.environ.get("LAVA_USERNAME")
 LAVA_HOST = os.environ.get("LAVA_HOST")
@@ -57,50 +62,77 @@ def get_job_bundle_content(server, job):
     return json.loads(bundle["content"])
 
 
-def check_job_all_test_cases_state_count(server, job):
+class TestCaseCounter:
     """
-    Parse the results bundle to see the run-tests testcase
-    of the lttng-kernel-tests passed successfully
+    Callback counting the test case results of a job, failures are printed as
+    they are counted. Return True once more than max_failures test cases
+    failed.
     """
-    print("Testcase result:")
-    content = server.results.get_testjob_results_yaml(str(job))
-    testcases = yaml.load(content, Loader=yaml.Loader)
 
-    passed_tests = 0
-    failed_tests = 0
-    for testcase in testcases:
+    def __init__(self, max_failures=None):
+        self.max_failures = max_failures
+        self.passed = 0
+        self.failed = 0
+
+    def __call__(self, testcase):
         if testcase["result"] != "pass":
             print(
                 "\tFAILED {}\n\t\t See {}://{}{}".format(
                     testcase["name"], LAVA_PROTO, LAVA_HOST, testcase["url"]
-                )
+                ),
+                flush=True,
             )
-            failed_tests += 1
+            self.failed += 1
         else:
-            passed_tests += 1
-    return (passed_tests, failed_tests)
+            self.passed += 1
+        return self.max_failures is not None and self.failed > self.max_failures
 
 
-def print_test_output(server, job):
+def check_job_all_test_cases_state_count(server, job):
     """
-    Parse the attachment of the testcase to fetch the stdout of the test suite
+    Parse the results bundle to see the run-tests testcase
+    of the lttng-kernel-tests passed successfully
     """
-    job_finished, log = server.scheduler.jobs.logs(str(job))
-    logs = yaml.load(log.data.decode("ascii"), Loader=yaml.Loader)
-    print_line = False
-    for line in logs:
-        if line["lvl"] != "target":
-            continue
+    print("Testcase result:")
+    content = server.results.get_testjob_results_yaml(str(job))
+    testcases = yaml.load(content, Loader=lava_client.yaml_loader())
+
+    counter = TestCaseCounter()
+    for testcase in testcases:
+        counter(testcase)
+    return (counter.passed, counter.failed)
+
+
+class TestOutputPrinter:
+    """
+    Callback printing the stdout of the test suite, the target output between
+    the start and the end of the run-tests testcase, from the log entries of
+    a job as they are received.
+    """
+
+    def __init__(self):
+        self.print_line = False
+
+    def __call__(self, line):
+        if line.get("lvl") != "target":
+            return
         if line["msg"] == "<LAVA_SIGNAL_STARTTC run-tests>":
-            print("---- TEST SUITE OUTPUT BEGIN ----")
-            print_line = True
-            continue
+            print("---- TEST SUITE OUTPUT BEGIN ----", flush=True)
+            self.print_line = True
+            return
         if line["msg"] == "<LAVA_SIGNAL_ENDTC run-tests>":
-            print("----- TEST SUITE OUTPUT END -----")
-            print_line = False
-            continue
-        if print_line:
-            print("{} {}".format(line["dt"], line["msg"]))
+            print("----- TEST SUITE OUTPUT END -----", flush=True)
+            self.print_line = False
+            return
+        if self.print_line:
+            print("{} {}".format(line["dt"], line["msg"]), flush=True)
+
+
+def print_test_output(server, job):
+    """
+    Parse the log of a finished job to print the stdout of the test suite
+    """
+    lava_client.read_logs(server, job, TestOutputPrinter())
 
 
 def main():
@@ -126,6 +158,25 @@ def main():
     parser.add_argument("--ci-repo", required=True)
     parser.add_argument("--ci-branch", required=False, default="master")
     parser.add_argument("--debug", action="store_true")
+    parser.add_argument(
+        "--no-follow-logs",
+        action="store_true",
+        help="Print the test suite output once the job is finished instead of "
+        "streaming it while the job runs",
+    )
+    parser.add_argument(
+        "--live-results",
+        action="store_true",
+        help="Follow the test case results while the job runs and print the "
+        "failures as they happen",
+    )
+    parser.add_argument(
+        "--max-failures",
+        type=int,
+        default=None,
+        help="Cancel the job once more than this number of test cases failed, "
+        "implies --live-results",
+    )
 
     args = parser.parse_args()
 
@@ -193,10 +244,15 @@ def main():
     context["s3_base_dir"] = S3_BASE_DIR
 
     # Render the lava job template
-    jinja_loader = FileSystemLoader(os.path.dirname(os.path.realpath(__file__)))
-    jinja_env = Environment(loader=jinja_loader, trim_blocks=True, lstrip_blocks=True)
-    jinja_template = jinja_env.get_template("template_lava_job.yml.jinja2")
-    render = jinja_template.render(context)
+    try:
+        render = lava_job.render(
+            os.path.dirname(os.path.realpath(__file__)),
+            "template_lava_job.yml.jinja2",
+            context,
+        )
+    except lava_job.JobDefinitionError as error:
+        print("Invalid job definition:", error)
+        return -1
 
     print("Job to be submitted:")
 
@@ -205,9 +261,7 @@ def main():
     if args.debug:
         return 0
 
-    server = xmlrpc.client.ServerProxy(
-        "%s://%s:%s@%s/RPC2" % (LAVA_PROTO, LAVA_USERNAME, lava_api_key, LAVA_HOST)
-    )
+    server = lava_client.get_server(LAVA_PROTO, LAVA_USERNAME, lava_api_key, LAVA_HOST)
 
     # Submit the job to lava
     for attempt in range(1, send_retry_limit + 1):
@@ -235,28 +289,38 @@ def main():
     print("Lava jobid:{}".format(jobid))
     print("Lava job URL: {}://{}/scheduler/job/{}".format(LAVA_PROTO, LAVA_HOST, jobid))
 
-    # Check the status of the job every 30 seconds
-    jobstatus = server.scheduler.job_state(jobid)["job_state"]
-    running = False
-    while jobstatus in ["Submitted", "Scheduling", "Scheduled", "Running"]:
-        if not running and jobstatus == "Running":
-            print("Job started running")
-            running = True
-        time.sleep(30)
-        try:
-            jobstatus = server.scheduler.job_state(jobid)["job_state"]
-        except xmlrpc.client.ProtocolError as error:
-            print("Protocol error, retrying")
-            continue
-    print("Job ended with {} status.".format(jobstatus))
+    has_test_output = (
+        test_type is TestType.kvm_tests or test_type is TestType.baremetal_tests
+    )
+    follow_logs = has_test_output and not args.no_follow_logs
+
+    counter = None
+    if args.live_results or args.max_failures is not None:
+        counter = TestCaseCounter(args.max_failures)
+
+    jobstatus = lava_client.wait_for_job(
+        server,
+        jobid,
+        on_log_entry=TestOutputPrinter() if follow_logs else None,
+        on_result=counter,
+    )
 
     if jobstatus != "Finished":
+        if counter is not None and counter.failed:
+            print(
+                "With {} passed and {} failed Lava test cases.".format(
+                    counter.passed, counter.failed
+                )
+            )
         return -1
 
-    if test_type is TestType.kvm_tests or test_type is TestType.baremetal_tests:
+    if has_test_output and not follow_logs:
         print_test_output(server, jobid)
 
-    passed, failed = check_job_all_test_cases_state_count(server, jobid)
+    if counter is not None:
+        passed, failed = counter.passed, counter.failed
+    else:
+        passed, failed = check_job_all_test_cases_state_count(server, jobid)
     print("With {} passed and {} failed Lava test cases.".format(passed, failed))
 
     if failed != 0:
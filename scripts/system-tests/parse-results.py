@@ -1,174 +1,265 @@
 #! /usr/bin/python3
+import argparse
 import csv
+import platform
 import sys
 from collections import defaultdict
-from subprocess import call
 
 import numpy as np
 import pandas as pd
+import results_store
+import scaling
 
+# Columns identifying a group of results
+GROUP_KEYS = ["nbthreads", "tracer", "testcase", "sleeptime"]
 
-def test_case(df):
+# Aggregated columns: (column, statistic, test case suffix, units)
+METRICS = [
+    ("usecperiter", "mean", "peritermean", "usec/iter"),
+    ("usecperiter", "std", "periterstdev", "usec/iter"),
+    ("nbiter", "mean", "nbitermean", "iterations"),
+    ("nbiter", "std", "nbiterstdev", "iterations"),
+    ("duration", "mean", "durationmean", "usec"),
+    ("duration", "std", "durationstdev", "usec"),
+]
+
+COLUMNS = sorted({column for column, _, _, _ in METRICS})
+
+
+def add_usecperiter(df):
     # Duration is in usec
     # usecPecIter = Duration/(average number of iteration per thread)
-    df["usecperiter"] = (df["nbthreads"] * df["duration"]) / df["nbiter"]
-
-    periter_mean = pd.DataFrame(
-        {
-            "periter_mean": df.groupby(
-                ["nbthreads", "tracer", "testcase", "sleeptime"]
-            )["usecperiter"].mean()
-        }
-    ).reset_index()
-
-    periter_stdev = pd.DataFrame(
-        {
-            "periter_stdev": df.groupby(
-                ["nbthreads", "tracer", "testcase", "sleeptime"]
-            )["usecperiter"].std()
-        }
-    ).reset_index()
-
-    nbiter_mean = pd.DataFrame(
-        {
-            "nbiter_mean": df.groupby(["nbthreads", "tracer", "testcase", "sleeptime"])[
-                "nbiter"
-            ].mean()
-        }
-    ).reset_index()
-
-    nbiter_stdev = pd.DataFrame(
-        {
-            "nbiter_stdev": df.groupby(
-                ["nbthreads", "tracer", "testcase", "sleeptime"]
-            )["nbiter"].std()
-        }
-    ).reset_index()
-
-    duration_mean = pd.DataFrame(
-        {
-            "duration_mean": df.groupby(
-                ["nbthreads", "tracer", "testcase", "sleeptime"]
-            )["duration"].mean()
-        }
-    ).reset_index()
-
-    duration_stdev = pd.DataFrame(
-        {
-            "duration_stdev": df.groupby(
-                ["nbthreads", "tracer", "testcase", "sleeptime"]
-            )["duration"].std()
-        }
-    ).reset_index()
-
-    tmp = periter_mean.merge(periter_stdev)
-
-    tmp = tmp.merge(nbiter_mean)
-    tmp = tmp.merge(nbiter_stdev)
-
-    tmp = tmp.merge(duration_mean)
-    tmp = tmp.merge(duration_stdev)
+    return df.assign(usecperiter=(df["nbthreads"] * df["duration"]) / df["nbiter"])
 
-    # if there is any NaN or None value in the DF we raise an exeception
-    if tmp.isnull().values.any():
-        raise Exception("NaN value found in dataframe")
 
-    for i, row in tmp.iterrows():
-        testcase_name = "_".join(
-            [row["tracer"], str(row["nbthreads"]) + "thr", "peritermean"]
-        )
-        yield (
-            {
-                "name": testcase_name,
-                "result": "pass",
-                "units": "usec/iter",
-                "measurement": str(row["periter_mean"]),
+def aggregate(df):
+    """
+    Compute the mean and standard deviation of every metric of each group in
+    a single groupby pass. Return a DataFrame with one row per group and one
+    "{column}_{statistic}" column per metric.
+    """
+    return (
+        add_usecperiter(df)
+        .groupby(GROUP_KEYS)
+        .agg(
+            **{
+                "{}_{}".format(column, stat): (column, stat)
+                for column, stat, _, _ in METRICS
             }
         )
+        .reset_index()
+    )
 
-        testcase_name = "_".join(
-            [row["tracer"], str(row["nbthreads"]) + "thr", "periterstdev"]
-        )
-        yield (
-            {
-                "name": testcase_name,
-                "result": "pass",
-                "units": "usec/iter",
-                "measurement": str(row["periter_stdev"]),
-            }
-        )
 
-        testcase_name = "_".join(
-            [row["tracer"], str(row["nbthreads"]) + "thr", "nbitermean"]
-        )
-        yield (
-            {
-                "name": testcase_name,
-                "result": "pass",
-                "units": "iterations",
-                "measurement": str(row["nbiter_mean"]),
-            }
-        )
+def partial_moments(df):
+    """
+    Return the count, mean and sum of squared deviations (M2) of every column
+    of each group of a chunk of results.
+    """
+    grouped = add_usecperiter(df).groupby(GROUP_KEYS)[COLUMNS]
+    counts = grouped.count()
+    means = grouped.mean()
+    m2 = grouped.var(ddof=0) * counts
+    return counts, means, m2
 
-        testcase_name = "_".join(
-            [row["tracer"], str(row["nbthreads"]) + "thr", "nbiterstdev"]
-        )
-        yield (
-            {
-                "name": testcase_name,
-                "result": "pass",
-                "units": "iterations",
-                "measurement": str(row["nbiter_stdev"]),
-            }
-        )
 
-        testcase_name = "_".join(
-            [row["tracer"], str(row["nbthreads"]) + "thr", "durationmean"]
-        )
-        yield (
-            {
-                "name": testcase_name,
-                "result": "pass",
-                "units": "usec",
-                "measurement": str(row["duration_mean"]),
-            }
-        )
+def combine_moments(acc, partial):
+    """
+    Merge the moments of two sets of chunks (Chan et al. parallel variance).
+    """
+    if acc is None:
+        return partial
+    (n_a, mean_a, m2_a), (n_b, mean_b, m2_b) = acc, partial
+    n_a, n_b = n_a.align(n_b, fill_value=0)
+    mean_a, mean_b = mean_a.align(mean_b, fill_value=0)
+    m2_a, m2_b = m2_a.align(m2_b, fill_value=0)
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * n_b / n
+    m2 = m2_a + m2_b + delta**2 * n_a * n_b / n
+    return n, mean, m2
+
 
-        testcase_name = "_".join(
-            [row["tracer"], str(row["nbthreads"]) + "thr", "durationstdev"]
+def aggregate_csv(path, chunksize):
+    """
+    Like aggregate() on the content of a CSV file, read by chunks of
+    chunksize rows so that the memory usage does not depend on the size of
+    the file.
+    """
+    acc = None
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        acc = combine_moments(acc, partial_moments(chunk))
+    if acc is None:
+        return pd.DataFrame(
+            columns=GROUP_KEYS
+            + ["{}_{}".format(column, stat) for column, stat, _, _ in METRICS]
         )
-        yield (
-            {
-                "name": testcase_name,
-                "result": "pass",
-                "units": "usec",
-                "measurement": str(row["duration_stdev"]),
-            }
+
+    counts, means, m2 = acc
+    stats = {}
+    for column, stat, _, _ in METRICS:
+        if stat == "mean":
+            values = means[column]
+        else:
+            # Sample standard deviation, NaN for single values like pandas.
+            dof = (counts[column] - 1).where(counts[column] > 1)
+            values = np.sqrt(m2[column] / dof)
+        stats["{}_{}".format(column, stat)] = values
+    return pd.DataFrame(stats).sort_index().reset_index()
+
+
+def test_case(df):
+    return test_case_results(aggregate(df))
+
+
+def test_case_results(stats):
+    """
+    Yield the test case results of the aggregated statistics, see
+    aggregate().
+    """
+    # if there is any NaN or None value in the DF we raise an exeception
+    if stats.isnull().values.any():
+        raise Exception("NaN value found in dataframe")
+
+    prefixes = [
+        "_".join([tracer, str(nbthreads) + "thr"])
+        for tracer, nbthreads in zip(stats["tracer"], stats["nbthreads"].tolist())
+    ]
+    columns = [
+        (suffix, units, stats["{}_{}".format(column, stat)].tolist())
+        for column, stat, suffix, units in METRICS
+    ]
+    for row, prefix in enumerate(prefixes):
+        for suffix, units, values in columns:
+            yield (
+                {
+                    "name": "_".join([prefix, suffix]),
+                    "result": "pass",
+                    "units": units,
+                    "measurement": str(values[row]),
+                }
+            )
+
+
+def long_results(stats):
+    """
+    Yield the aggregated statistics, see aggregate(), in the long format of
+    the results store: one dictionary per group and metric.
+    """
+    keys = {key: stats[key].tolist() for key in GROUP_KEYS}
+    for column, stat, suffix, units in METRICS:
+        values = stats["{}_{}".format(column, stat)].tolist()
+        for row, value in enumerate(values):
+            result = {key: keys[key][row] for key in GROUP_KEYS}
+            result.update({"metric": suffix, "units": units, "value": value})
+            yield result
+
+
+def format_signal(result):
+    """
+    Return the LAVA test case signal of a result, the line printed by the
+    lava-test-case helper. Results without measurement, such as skipped
+    test cases, only have a result.
+    """
+    if "measurement" not in result:
+        return "<LAVA_SIGNAL_TESTCASE TEST_CASE_ID={} RESULT={}>".format(
+            result["name"], result["result"]
         )
+    return "<LAVA_SIGNAL_TESTCASE TEST_CASE_ID={} RESULT={} MEASUREMENT={} UNITS={}>".format(
+        result["name"], result["result"], result["measurement"], result["units"]
+    )
+
+
+def report(results, out=sys.stdout):
+    """
+    Report the results to LAVA by writing their test case signals in a single
+    batch, instead of running the lava-test-case helper once per result.
+    """
+    out.write("".join(format_signal(res) + "\n" for res in results))
+    out.flush()
 
 
 def main():
-    results_file = sys.argv[1]
-    df = pd.read_csv(results_file)
+    parser = argparse.ArgumentParser(description="Parse the perf test results")
+    parser.add_argument("results_file", help="The CSV file of the test results")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=0,
+        help="Read the results by chunks of N rows to bound the memory usage "
+        "(default: 0, read the whole file at once)",
+    )
+    parser.add_argument(
+        "--store",
+        help="Append the results to this SQLite results store, see results_store.py",
+    )
+    parser.add_argument("--commit", help="The commit of the run, for the results store")
+    parser.add_argument(
+        "--kernel",
+        default=platform.release(),
+        help="The kernel of the run, for the results store (default: the running kernel)",
+    )
+    parser.add_argument(
+        "--metadata",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Additional metadata of the run for the results store, can be repeated",
+    )
+    parser.add_argument(
+        "--scaling",
+        action="store_true",
+        help="Also report the scalability of each tracer with the number of threads",
+    )
+    parser.add_argument(
+        "--scaling-plot",
+        metavar="PATH",
+        help="Save a summary plot of the scalability analysis, implies --scaling",
+    )
+    parser.add_argument(
+        "--max-cost-exponent",
+        type=float,
+        default=scaling.DEFAULT_MAX_COST_EXPONENT,
+        help="Fail the cost exponent test case of the tracers whose per-iteration "
+        "cost grows faster than nbthreads^EXPONENT (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    metadata = {}
+    for value in args.metadata:
+        key, sep, value = value.partition("=")
+        if not sep:
+            parser.error("Invalid metadata {}, expected KEY=VALUE".format(key))
+        metadata[key] = value
+
+    if args.chunksize > 0:
+        stats = aggregate_csv(args.results_file, args.chunksize)
+    else:
+        stats = aggregate(pd.read_csv(args.results_file))
+    data = list(test_case_results(stats))
+    report(data)
+
+    if args.scaling or args.scaling_plot:
+        points, fits = scaling.analyze(stats, args.max_cost_exponent)
+        report(scaling.test_case_results(points, fits))
+        if args.scaling_plot:
+            scaling.plot(points, fits, args.scaling_plot)
+
+    # Save the results to write to the CSV file
     results = defaultdict()
-    data = test_case(df)
     for res in data:
-        call(
-            [
-                "lava-test-case",
-                res["name"],
-                "--result",
-                res["result"],
-                "--measurement",
-                res["measurement"],
-                "--units",
-                res["units"],
-            ]
-        )
-
-        # Save the results to write to the CSV file
         results[res["name"]] = res["measurement"]
 
+    if args.store:
+        with results_store.ResultStore(args.store) as store:
+            run_id = store.add_run(
+                long_results(stats),
+                commit=args.commit,
+                kernel=args.kernel,
+                metadata=metadata,
+            )
+        print("Results stored as run {} in {}".format(run_id, args.store))
+
     # Write the dictionnary to a csv file where each key is a column
     with open("processed_results.csv", "w") as output_csv:
         dict_csv_write = csv.DictWriter(output_csv, results.keys())
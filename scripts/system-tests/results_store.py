@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+# SPDX-FileCopyrightText: 2026 EfficiOS Inc.
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Append-only history of the perf regression test results, stored in an
+SQLite database in long format: one row per run, tracer, number of threads
+and metric. Each run records the commits and the kernel it was measured
+with so that a run can be compared against the previous ones.
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+# Columns identifying a result within a run
+RESULT_KEYS = ["tracer", "nbthreads", "testcase", "sleeptime", "metric"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    time REAL NOT NULL,
+    commit_id TEXT,
+    kernel TEXT,
+    metadata TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    tracer TEXT NOT NULL,
+    nbthreads INTEGER NOT NULL,
+    testcase TEXT NOT NULL,
+    sleeptime INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    units TEXT,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_run ON results(run_id);
+"""
+
+
+class ResultStore:
+    """
+    Results history stored in the SQLite database at path, created if it
+    does not exist. Runs are only ever added.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_run(self, results, commit=None, kernel=None, metadata=None):
+        """
+        Add a run and return its id. results is an iterable of dictionaries
+        with the RESULT_KEYS, "units" and "value" keys. metadata, when set,
+        is a dictionary stored as JSON (e.g. the commits of each project).
+        """
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO runs (time, commit_id, kernel, metadata) VALUES (?, ?, ?, ?)",
+                (
+                    time.time(),
+                    commit,
+                    kernel,
+                    json.dumps(metadata) if metadata is not None else None,
+                ),
+            )
+            run_id = cursor.lastrowid
+            self.db.executemany(
+                "INSERT INTO results (run_id, tracer, nbthreads, testcase, sleeptime, "
+                "metric, units, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        run_id,
+                        res["tracer"],
+                        int(res["nbthreads"]),
+                        str(res["testcase"]),
+                        int(res["sleeptime"]),
+                        res["metric"],
+                        res["units"],
+                        float(res["value"]),
+                    )
+                    for res in results
+                ),
+            )
+        return run_id
+
+    def runs(self, last=None):
+        """
+        Return the runs, most recent first, as a DataFrame. Only the last
+        runs are returned when last is set.
+        """
+        query = "SELECT * FROM runs ORDER BY run_id DESC"
+        params = ()
+        if last is not None:
+            query += " LIMIT ?"
+            params = (last,)
+        return pd.read_sql_query(query, self.db, params=params)
+
+    def results(self, run_ids):
+        """
+        Return the results of the runs as a long format DataFrame.
+        """
+        run_ids = list(run_ids)
+        if not run_ids:
+            return pd.DataFrame(columns=["run_id"] + RESULT_KEYS + ["units", "value"])
+        return pd.read_sql_query(
+            "SELECT * FROM results WHERE run_id IN ({})".format(
+                ",".join("?" * len(run_ids))
+            ),
+            self.db,
+            params=run_ids,
+        )
+
+    def compare(self, run_id=None, last=5):
+        """
+        Compare a run, the most recent one by default, against the last runs
+        which preceded it. Return a DataFrame indexed by RESULT_KEYS with the
+        value of the run, the mean, standard deviation and count of the
+        baseline values and the relative change of the value from the
+        baseline mean. Results without baseline have NaN statistics.
+        """
+        if run_id is None:
+            run_id = self.db.execute("SELECT MAX(run_id) FROM runs").fetchone()[0]
+            if run_id is None:
+                raise ValueError("The results store is empty")
+        baseline_ids = [
+            row[0]
+            for row in self.db.execute(
+                "SELECT run_id FROM runs WHERE run_id < ? ORDER BY run_id DESC LIMIT ?",
+                (run_id, last),
+            )
+        ]
+
+        current = self.results([run_id]).set_index(RESULT_KEYS)
+        baseline = (
+            self.results(baseline_ids)
+            .groupby(RESULT_KEYS)["value"]
+            .agg(baseline_mean="mean", baseline_std="std", baseline_runs="count")
+        )
+        comparison = current[["units", "value"]].join(baseline, how="left")
+        comparison["baseline_runs"] = comparison["baseline_runs"].fillna(0).astype(int)
+        comparison["change"] = (
+            comparison["value"] - comparison["baseline_mean"]
+        ) / comparison["baseline_mean"]
+        return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the perf results history")
+    parser.add_argument("store", help="The SQLite results store")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("runs", help="List the runs")
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare a run against the previous runs"
+    )
+    compare_parser.add_argument(
+        "--run", type=int, default=None, help="The run id (default: the last run)"
+    )
+    compare_parser.add_argument(
+        "--last", type=int, default=5, help="Number of previous runs (default: 5)"
+    )
+    compare_parser.add_argument(
+        "--metric",
+        action="append",
+        help="Only show this metric, can be repeated (default: all)",
+    )
+    args = parser.parse_args()
+
+    with ResultStore(args.store) as store:
+        if args.action == "runs":
+            table = store.runs()
+        else:
+            table = store.compare(args.run, args.last)
+            if args.metric:
+                table = table[table.index.get_level_values("metric").isin(args.metric)]
+    table.to_csv(sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+# SPDX-FileCopyrightText: 2026 EfficiOS Inc.
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Scalability analysis of the perf regression test results.
+
+For each series of results, a tracer running a test case with a sleep
+time, the throughput at N threads, X(N) = N / (mean cost of an
+iteration on a thread), is compared to the throughput at the smallest
+number of threads measured to get the speedup S(N) and the parallel
+efficiency S(N) / N. The speedups are fitted to the Universal Scalability
+Law:
+
+    S(N) = N / (1 + sigma * (N - 1) + kappa * N * (N - 1))
+
+where sigma is the contention and kappa the coherency coefficient, and to
+Amdahl's law, the same model with kappa = 0. Both are linear least squares
+problems once written as N / S(N) - 1 = sigma * (N - 1) + kappa * N * (N - 1).
+
+The growth of the per-iteration cost with the number of threads is the
+exponent of a power law fitted to it, a series is flagged when the cost
+grows faster than linearly. The fits need at least two numbers of threads
+(three for the USL), their test cases are skipped otherwise.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Columns identifying a series of results, measured at many numbers of threads
+SERIES_KEYS = ["tracer", "testcase", "sleeptime"]
+
+# Cost growth exponent above which a series is flagged
+DEFAULT_MAX_COST_EXPONENT = 1.0
+
+
+def fit_usl(nbthreads, speedup):
+    """
+    Fit the USL to the speedups, return (sigma, kappa). NaN when there are
+    not enough thread counts.
+    """
+    n = np.asarray(nbthreads, dtype=float)
+    if len(np.unique(n[n > 1])) < 2:
+        return float("nan"), float("nan")
+    y = n / np.asarray(speedup, dtype=float) - 1
+    a = np.column_stack([n - 1, n * (n - 1)])
+    (sigma, kappa), *_ = np.linalg.lstsq(a, y, rcond=None)
+    return float(sigma), float(kappa)
+
+
+def fit_amdahl(nbthreads, speedup):
+    """
+    Fit Amdahl's law to the speedups, return the serial fraction sigma. NaN
+    when there are not enough thread counts.
+    """
+    n = np.asarray(nbthreads, dtype=float)
+    if len(np.unique(n)) < 2:
+        return float("nan")
+    y = n / np.asarray(speedup, dtype=float) - 1
+    x = n - 1
+    return float(np.dot(x, y) / np.dot(x, x))
+
+
+def usl_speedup(nbthreads, sigma, kappa=0.0):
+    """
+    Return the speedups predicted by the USL coefficients.
+    """
+    n = np.asarray(nbthreads, dtype=float)
+    return n / (1 + sigma * (n - 1) + kappa * n * (n - 1))
+
+
+def cost_exponent(nbthreads, cost):
+    """
+    Return the exponent b of the power law cost = a * nbthreads^b fitted to
+    the per-iteration costs, NaN when there are not enough thread counts.
+    """
+    n = np.asarray(nbthreads, dtype=float)
+    if len(np.unique(n)) < 2:
+        return float("nan")
+    slope, _ = np.polyfit(np.log(n), np.log(np.asarray(cost, dtype=float)), 1)
+    return float(slope)
+
+
+def series_name(series):
+    """
+    Return the test case name prefix of a series, a dictionary holding the
+    SERIES_KEYS.
+    """
+    return "_".join(
+        [
+            series["tracer"],
+            str(series["testcase"]),
+            "sleep{}".format(series["sleeptime"]),
+        ]
+    )
+
+
+def analyze(stats, max_cost_exponent=DEFAULT_MAX_COST_EXPONENT):
+    """
+    Analyze the scalability of each series from the aggregated statistics,
+    see aggregate() in parse-results.py, which hold the mean cost of an
+    iteration per number of threads in the "usecperiter_mean" column.
+
+    Return (points, fits): points has one row per series and number of
+    threads with the throughput, speedup and efficiency, fits one row per
+    series with the USL and Amdahl coefficients, the cost exponent and
+    whether the cost grows superlinearly. The coefficients which can't be
+    fitted are NaN.
+    """
+    points = []
+    fits = []
+    for key, group in stats.groupby(SERIES_KEYS, sort=True):
+        series = dict(zip(SERIES_KEYS, key))
+        group = group.sort_values("nbthreads")
+        nbthreads = group["nbthreads"].to_numpy(dtype=float)
+        cost = group["usecperiter_mean"].to_numpy(dtype=float)
+        throughput = nbthreads / cost
+        # Speedup relative to the smallest number of threads, scaled so that
+        # it is that number of threads when the scaling is perfect.
+        speedup = throughput / throughput[0] * nbthreads[0]
+        efficiency = speedup / nbthreads
+        points.append(
+            pd.DataFrame(
+                dict(
+                    series,
+                    nbthreads=group["nbthreads"].to_numpy(),
+                    cost=cost,
+                    throughput=throughput,
+                    speedup=speedup,
+                    efficiency=efficiency,
+                )
+            )
+        )
+
+        sigma, kappa = fit_usl(nbthreads, speedup)
+        exponent = cost_exponent(nbthreads, cost)
+        fits.append(
+            dict(
+                series,
+                usl_sigma=sigma,
+                usl_kappa=kappa,
+                amdahl_sigma=fit_amdahl(nbthreads, speedup),
+                cost_exponent=exponent,
+                superlinear=bool(exponent > max_cost_exponent),
+            )
+        )
+    return pd.concat(points, ignore_index=True), pd.DataFrame(fits)
+
+
+def test_case_results(points, fits):
+    """
+    Yield the test case results of the scalability analysis. The cost
+    exponent test case of a series fails when its per-iteration cost grows
+    superlinearly. The test cases of the coefficients which can't be fitted
+    are skipped, without measurement.
+    """
+    for point in points.to_dict("records"):
+        prefix = "_".join([series_name(point), str(point["nbthreads"]) + "thr"])
+        yield {
+            "name": prefix + "_speedup",
+            "result": "pass",
+            "units": "x",
+            "measurement": str(point["speedup"]),
+        }
+        yield {
+            "name": prefix + "_efficiency",
+            "result": "pass",
+            "units": "ratio",
+            "measurement": str(point["efficiency"]),
+        }
+
+    for fit in fits.to_dict("records"):
+        prefix = series_name(fit)
+        for key, units in [
+            ("usl_sigma", "coefficient"),
+            ("usl_kappa", "coefficient"),
+            ("amdahl_sigma", "coefficient"),
+            ("cost_exponent", "exponent"),
+        ]:
+            name = "_".join([prefix, key])
+            if np.isnan(fit[key]):
+                yield {"name": name, "result": "skip"}
+                continue
+            result = "pass"
+            if key == "cost_exponent" and fit["superlinear"]:
+                result = "fail"
+            yield {
+                "name": name,
+                "result": result,
+                "units": units,
+                "measurement": str(fit[key]),
+            }
+
+
+def plot(points, fits, path):
+    """
+    Save a summary plot of the analysis: the speedups with their USL fit and
+    the ideal scaling, and the per-iteration costs.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, (ax_speedup, ax_cost) = plt.subplots(1, 2, figsize=(11, 4.5))
+    max_threads = points["nbthreads"].max()
+    curve = np.linspace(1, max_threads, 100)
+    ax_speedup.plot(curve, curve, color="grey", linestyle=":", label="ideal")
+
+    for fit in fits.to_dict("records"):
+        series_points = points[
+            (points[SERIES_KEYS] == pd.Series(fit)[SERIES_KEYS]).all(axis=1)
+        ]
+        label = series_name(fit)
+        if fit["superlinear"]:
+            label += " (superlinear cost)"
+        line = ax_speedup.plot(
+            series_points["nbthreads"], series_points["speedup"], "o", label=label
+        )[0]
+        if not np.isnan(fit["usl_sigma"]):
+            ax_speedup.plot(
+                curve,
+                usl_speedup(curve, fit["usl_sigma"], fit["usl_kappa"]),
+                color=line.get_color(),
+                linewidth=1,
+            )
+        ax_cost.plot(
+            series_points["nbthreads"],
+            series_points["cost"],
+            "o-",
+            color=line.get_color(),
+            label="{} (exponent {:.2f})".format(series_name(fit), fit["cost_exponent"]),
+        )
+
+    ax_speedup.set_title("Speedup (points) and USL fit (lines)")
+    ax_speedup.set_xlabel("Threads")
+    ax_speedup.set_ylabel("Speedup")
+    ax_speedup.legend(fontsize="small")
+    ax_speedup.grid(True, alpha=0.3)
+
+    ax_cost.set_title("Cost of an iteration on a thread")
+    ax_cost.set_xlabel("Threads")
+    ax_cost.set_ylabel("usec/iter")
+    ax_cost.set_xscale("log", base=2)
+    ax_cost.set_yscale("log")
+    ax_cost.legend(fontsize="small")
+    ax_cost.grid(True, alpha=0.3)
+
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)